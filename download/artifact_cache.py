@@ -0,0 +1,152 @@
+import os
+import json
+import shutil
+import hashlib
+
+DEFAULT_CACHE_DIR = os.path.join("utils", "cache", "artifacts")
+DEFAULT_MAX_SIZE_GB = 50
+HASH_READ_SIZE = 4 * 1024 * 1024
+CHECKSUM_DIR = ".checksums"  # Per download directory: <name>.json with the artifact checksum
+
+
+def artifact_checksum(artifact):
+    """Return (algorithm, hexdigest) for the strongest checksum an artifact carries"""
+    for algorithm in ("sha256", "sha1"):
+        value = artifact.get(algorithm)
+        if value:
+            return algorithm, value.lower()
+    return None, None
+
+
+def file_checksum(path, algorithm):
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_READ_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _checksum_note(path):
+    return os.path.join(os.path.dirname(os.path.abspath(path)), CHECKSUM_DIR, os.path.basename(path) + ".json")
+
+
+def record_checksum(path, artifact):
+    """Note the Artifactory checksum of a downloaded file, so later steps need not hash it again"""
+    algorithm, digest = artifact_checksum(artifact)
+    if not algorithm:
+        return
+    stat = os.stat(path)
+    note = _checksum_note(path)
+    try:
+        os.makedirs(os.path.dirname(note), exist_ok=True)
+        with open(note, "w", encoding="utf-8") as f:
+            json.dump({"algorithm": algorithm, "digest": digest, "size": stat.st_size,
+                       "inode": stat.st_ino, "mtime_ns": stat.st_mtime_ns}, f)
+    except OSError as e:
+        print(f"[WARN] Could not record checksum of {os.path.basename(path)}: {e}")
+
+
+def recorded_checksum(path):
+    """Return (algorithm, hexdigest) noted by record_checksum, or (None, None) if path changed since"""
+    try:
+        with open(_checksum_note(path), "r", encoding="utf-8") as f:
+            note = json.load(f)
+        stat = os.stat(path)
+        # Downloads and cache fetches always create a new file, so anything else means new content
+        if (note["size"], note["inode"], note["mtime_ns"]) == (stat.st_size, stat.st_ino, stat.st_mtime_ns):
+            return note["algorithm"], note["digest"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None, None
+
+
+def link_or_copy(src, dst):
+    """Hardlink src to dst, falling back to a copy across filesystems"""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class ArtifactCache:
+    """Content-addressed store of downloaded artifacts with LRU eviction
+
+    Objects live at <cache_dir>/<algorithm>/<hh>/<hexdigest>. The mtime of
+    each object is bumped on every hit and is used as its LRU timestamp.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_SIZE_GB * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def object_path(self, algorithm, digest):
+        return os.path.join(self.cache_dir, algorithm, digest[:2], digest)
+
+    def get(self, algorithm, digest):
+        """Return the cached object path for the checksum, or None"""
+        if not algorithm or not digest:
+            return None
+        path = self.object_path(algorithm, digest)
+        if not os.path.isfile(path):
+            return None
+        os.utime(path)
+        return path
+
+    def contains(self, artifact):
+        """True if the artifact's checksum is present in the cache"""
+        algorithm, digest = artifact_checksum(artifact)
+        return bool(algorithm) and os.path.isfile(self.object_path(algorithm, digest))
+
+    def fetch(self, artifact, output_path):
+        """Materialize a cached artifact at output_path, return True on a hit"""
+        cached = self.get(*artifact_checksum(artifact))
+        if not cached:
+            return False
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        link_or_copy(cached, output_path)
+        return True
+
+    def store(self, artifact, downloaded_path):
+        """Verify a downloaded file against the artifact checksum and add it to the cache"""
+        algorithm, digest = artifact_checksum(artifact)
+        if not algorithm:
+            return None
+        actual = file_checksum(downloaded_path, algorithm)
+        if actual != digest:
+            raise IOError(f"{algorithm} mismatch for {os.path.basename(downloaded_path)}: "
+                          f"expected {digest}, got {actual}")
+        path = self.object_path(algorithm, digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        link_or_copy(downloaded_path, tmp_path)
+        os.replace(tmp_path, path)
+        self.evict()
+        return path
+
+    def evict(self):
+        """Remove least recently used objects until the cache fits its quota"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                print(f"[INFO] Evicted cached artifact {path}")
+            except OSError:
+                continue
+        return total
+
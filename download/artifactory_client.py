@@ -0,0 +1,93 @@
+import json
+
+import requests
+from requests.adapters import HTTPAdapter
+
+ARTIFACTORY_URL = "https://spaws.jp.nissan.biz/artifactory/"
+RELEASE_REPO = "CCS_LGe"
+RELEASE_PATH = "release/LGE/CDC/NISSAN/{version}"
+
+TARGET_FILES = (
+    'RELEASE_IMAGES.tar.gz.aa',
+    'RELEASE_IMAGES.tar.gz.ab',
+    'NCDCIVI_RELEASE_IMAGES.tar.gz',
+    'NCDCMETER_RELEASE_IMAGES.tar.gz',
+)
+
+
+def proxies_from_config(config):
+    """Build a requests proxies dict from the [proxies] section of config.ini"""
+    if not config.getboolean("proxies", "use_proxy", fallback=False):
+        return {}
+    proxies = {}
+    for scheme in ("http", "https"):
+        value = config.get("proxies", scheme, fallback="").strip()
+        if value:
+            proxies[scheme] = value
+    return proxies
+
+
+class ArtifactoryClient:
+    """Minimal Artifactory REST/AQL client over one keep-alive session"""
+
+    def __init__(self, base_url=ARTIFACTORY_URL, auth=None, proxies=None, session=None, timeout=30):
+        self.base_url = base_url.rstrip("/") + "/"
+        self.timeout = timeout
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=2)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        if auth:
+            session.auth = auth
+        if proxies:
+            session.proxies.update(proxies)
+        self.session = session
+
+    def aql(self, query):
+        """Run an AQL query and return its "results" list"""
+        response = self.session.post(
+            self.base_url + "api/search/aql",
+            data=query,
+            headers={"Content-Type": "text/plain"},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return response.json().get("results", [])
+
+    def find_artifacts(self, version, names=TARGET_FILES, repo=RELEASE_REPO):
+        """Return the target artifacts of a release version with size and checksums
+
+        Only the requested file names under the version folder are matched
+        server-side, so the folder is never listed in full.
+        """
+        folder = RELEASE_PATH.format(version=version)
+        criteria = {
+            "repo": repo,
+            "type": "file",
+            "name": {"$in": list(names)},
+            "$or": [
+                {"path": folder},
+                {"path": {"$match": folder + "/*"}},
+            ],
+        }
+        query = (
+            f"items.find({json.dumps(criteria)})"
+            '.include("repo","path","name","size","actual_sha1","sha256")'
+        )
+
+        artifacts = []
+        for item in self.aql(query):
+            path = f"{item['repo']}/{item['path']}/{item['name']}"
+            artifacts.append({
+                "name": item["name"],
+                "url": self.base_url + path,
+                "size": item.get("size"),
+                "sha1": item.get("actual_sha1"),
+                "sha256": item.get("sha256"),
+            })
+        artifacts.sort(key=lambda a: a["name"])
+        return artifacts
+
+    def close(self):
+        self.session.close()
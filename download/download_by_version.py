@@ -1,19 +1,114 @@
-import subprocess
 import os
+import sys
+import threading
 import configparser
 from urllib.parse import urlparse
-import json
 
-# Read config.ini
-config = configparser.ConfigParser()
-config.read("config.ini")
+# Allow "python download/download_by_version.py" to import sibling packages
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
 
-artifactory_user = config["artifactory"]["username"]
-artifactory_token = config["artifactory"]["token"]
+from download.range_downloader import RangeDownloader, BandwidthLimiter, DEFAULT_CONNECTIONS, make_session
+from download.scheduler import DownloadScheduler, DEFAULT_WORKERS, DEFAULT_RETRIES
+from download.artifact_cache import ArtifactCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_SIZE_GB
+from download.artifactory_client import ArtifactoryClient, ARTIFACTORY_URL, proxies_from_config
+from download.search_cache import SearchCache, DEFAULT_SEARCH_CACHE_FILE, DEFAULT_TTL_MINUTES
+from extract.unzipper import EXTRACT_DIR, SPLIT_PART_RE, clear_extract_dir, extract_tar_gz, order_split_parts
+from extract.stream_extract import stream_extract_parts, delete_part_files
+
+CONFIG_PATH = "config.ini"
 
 # Download directory
 output_dir = os.path.join("utils", "downloads")
-os.makedirs(output_dir, exist_ok=True)
+# Files of a prefetched version land here only long enough to be added to the artifact cache
+prefetch_dir = os.path.join("utils", "cache", "prefetch")
+
+
+class DownloadSettings:
+    """Download, cache and Artifactory settings, read from config.ini when needed"""
+
+    def __init__(self, config_path=CONFIG_PATH):
+        self.config_path = os.path.abspath(config_path)
+        config = configparser.ConfigParser()
+        config.read(config_path)
+
+        self.artifactory_user = config["artifactory"]["username"]
+        self.artifactory_token = config["artifactory"]["token"]
+        self.artifactory_url = config.get("artifactory", "url", fallback=ARTIFACTORY_URL)
+        self.proxies = proxies_from_config(config)
+        self.connections = config.getint("download", "connections", fallback=DEFAULT_CONNECTIONS)
+        self.workers = config.getint("download", "workers", fallback=DEFAULT_WORKERS)
+        self.retries = config.getint("download", "retries", fallback=DEFAULT_RETRIES)
+        # Global cap shared by all concurrent downloads, in MB/s (0 = unlimited)
+        self.max_bandwidth_mbps = config.getfloat("download", "max_bandwidth_mbps", fallback=0)
+        # Extract split RELEASE archives while their parts are still downloading
+        self.stream_extract = config.getboolean("download", "stream_extract", fallback=False)
+        # Content-addressed artifact cache, reused across versions by checksum
+        self.artifact_cache_dir = config.get("cache", "artifact_dir", fallback=DEFAULT_CACHE_DIR)
+        self.artifact_cache_max_gb = config.getfloat("cache", "max_size_gb", fallback=DEFAULT_MAX_SIZE_GB)
+        self.search_cache_file = config.get("cache", "search_cache_file", fallback=DEFAULT_SEARCH_CACHE_FILE)
+        self.search_ttl_minutes = config.getfloat("cache", "search_ttl_minutes", fallback=DEFAULT_TTL_MINUTES)
+
+    @property
+    def auth(self):
+        return (self.artifactory_user, self.artifactory_token)
+
+
+_settings = None
+_client = None
+_search_cache = None
+_bandwidth_limiter = None
+_configure_lock = threading.Lock()
+
+
+def configure(settings=None, config_path=CONFIG_PATH):
+    """Select the settings used by this module and reset the objects built from them"""
+    global _settings, _client, _search_cache, _bandwidth_limiter
+    if _client is not None:
+        _client.close()
+    _settings = settings or DownloadSettings(config_path)
+    _client = None
+    _search_cache = None
+    _bandwidth_limiter = None
+    return _settings
+
+
+def ensure_configured(config_path=CONFIG_PATH):
+    """Configure from config_path unless it is already the active configuration
+
+    Unlike configure(), this keeps the shared client and caches, so
+    concurrent downloads can call it safely.
+    """
+    with _configure_lock:
+        if _settings is None or _settings.config_path != os.path.abspath(config_path):
+            configure(config_path=config_path)
+    return _settings
+
+
+def get_settings():
+    return _settings or ensure_configured()
+
+
+def get_search_cache():
+    """Version -> resolved artifact list, so retries of a version skip the Artifactory search"""
+    global _search_cache
+    if _search_cache is None:
+        settings = get_settings()
+        _search_cache = SearchCache(settings.search_cache_file, settings.search_ttl_minutes * 60)
+    return _search_cache
+
+
+def get_bandwidth_limiter():
+    global _bandwidth_limiter
+    if _bandwidth_limiter is None:
+        _bandwidth_limiter = BandwidthLimiter(get_settings().max_bandwidth_mbps * 1e6)
+    return _bandwidth_limiter
+
+
+def get_artifact_cache():
+    settings = get_settings()
+    return ArtifactCache(settings.artifact_cache_dir, int(settings.artifact_cache_max_gb * 1024 ** 3))
 
 def get_version():
     while True:
@@ -23,120 +118,202 @@ def get_version():
             continue
         return version
 
-def find_download_links(version, server_id='nissan-artifactory'):
-    jf_exe = os.path.join("utils", "jf.exe")
-    download_base = "https://spaws.jp.nissan.biz/artifactory/"
-
-    # Set environment variables for authentication
-    env = os.environ.copy()
-    env['JFROG_CLI_OFFER_CONFIG'] = 'false'
-    env['JFROG_CLI_USER'] = artifactory_user
-    env['JFROG_CLI_PASSWORD'] = artifactory_token
-
-    # Search path without date, directly under the version folder
-    repository_path = f'CCS_LGe/release/LGE/CDC/NISSAN/{version}/'
-
-    command = [
-        jf_exe,
-        'rt', 's',
-        repository_path + '**',
-        '--server-id', server_id,
-        '--recursive=true',
-        '--include-dirs=false'
-    ]
-
-    print(f"Running command: {' '.join(command)}")
-
-    result = subprocess.run(
-        command,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        env=env,
-        creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-    )
-
-    if result.returncode != 0:
-        print("Error querying Artifactory")
-        print(result.stderr)
-        return []
+def get_client():
+    """Return the shared Artifactory client, creating it on first use"""
+    global _client
+    if _client is None:
+        settings = get_settings()
+        _client = ArtifactoryClient(settings.artifactory_url, auth=settings.auth,
+                                    proxies=settings.proxies)
+    return _client
+
+def find_download_links(version, refresh=False):
+    search_cache = get_search_cache()
+    if not refresh:
+        artifacts = search_cache.get(version)
+        if artifacts:
+            print(f"Using cached search result for version {version}.")
+            return artifacts
 
+    print(f"Searching Artifactory for version {version}...")
     try:
-        json_data = json.loads(result.stdout.strip())
-    except json.JSONDecodeError:
-        print("Failed to parse JSON output")
+        artifacts = get_client().find_artifacts(version)
+    except Exception as e:
+        print(f"Error querying Artifactory: {e}")
+        # Offline fallback: an expired entry is still usable if every file is cached locally
+        artifacts = search_cache.get(version, allow_stale=True)
+        if artifacts and all(get_artifact_cache().contains(a) for a in artifacts):
+            print(f"Using expired search result for version {version}, all files are cached locally.")
+            return artifacts
         return []
 
-    target_files = {
-        'RELEASE_IMAGES.tar.gz.aa',
-        'RELEASE_IMAGES.tar.gz.ab',
-        'NCDCIVI_RELEASE_IMAGES.tar.gz',
-        'NCDCMETER_RELEASE_IMAGES.tar.gz'
-    }
-
-    download_urls = []
-    for item in json_data:
-        path = item.get("path", "")
-        if any(tf in path for tf in target_files):
-            repo = item.get('repo', '')
-            full_url = f"{download_base}{repo}/{path}"
-            download_urls.append(full_url)
-
-    if not download_urls:
+    if not artifacts:
         print("No target files found for this version.")
+    else:
+        search_cache.put(version, artifacts)
+
+    return artifacts
+
+def make_download_session():
+    """One pooled session for every download attempt of a run, with room for all their connections"""
+    settings = get_settings()
+    session = make_session(settings.workers * settings.connections)
+    session.auth = settings.auth
+    session.proxies.update(settings.proxies)
+    return session
 
-    return download_urls
+def make_downloader(session):
+    return RangeDownloader(connections=get_settings().connections,
+                           session=session,
+                           limiter=get_bandwidth_limiter())
 
-def download_file(url, index, total):
+def download_and_stream_extract(artifacts, scheduler, cancel_event=None):
+    """Download artifacts and extract them, streaming split archives as they arrive
+
+    Returns the scheduler results. Archives that were extracted are deleted
+    from the download directory once the downloads (including storing
+    each part in the artifact cache) have finished; if streaming fails
+    the parts are left in place for extract/unzipper.py to extract as usual.
+    """
+    groups = {}
+    for artifact in artifacts:
+        name = artifact_name(artifact)
+        match = SPLIT_PART_RE.match(name)
+        if match:
+            groups.setdefault(match.group("base"), []).append(os.path.join(output_dir, name))
+
+    results = {}
+    done_event = threading.Event()
+
+    def run_downloads():
+        try:
+            results.update(scheduler.run(artifacts, output_dir, cancel_event))
+        finally:
+            done_event.set()
+
+    download_thread = threading.Thread(target=run_downloads, daemon=True)
+    download_thread.start()
+
+    clear_extract_dir(EXTRACT_DIR)
+    streamed_all = True
+    streamed_parts = []
+    for base, parts in groups.items():
+        parts = order_split_parts(parts)
+        try:
+            # The scheduler may still be hashing the parts into the cache, delete them afterwards
+            stream_extract_parts(parts, EXTRACT_DIR, done_event, delete_parts=False, cancel_event=cancel_event)
+            streamed_parts.extend(parts)
+        except Exception as e:
+            print(f"[ERROR] Streaming extraction of {base} failed: {e}")
+            streamed_all = False
+    download_thread.join()
+
+    if results and all(results.values()):
+        delete_part_files(streamed_parts)
+
+    if streamed_all and results and all(results.values()):
+        for artifact in artifacts:
+            name = artifact_name(artifact)
+            path = os.path.join(output_dir, name)
+            if name.endswith(".tar.gz") and os.path.exists(path):
+                extract_tar_gz(path, EXTRACT_DIR)
+    return results
+
+def artifact_name(artifact):
+    return artifact.get("name") or os.path.basename(urlparse(artifact["url"]).path)
+
+def is_release_part(name):
+    """True for the split RELEASE_IMAGES.tar.gz.aa/.ab parts, False for the MCU tarballs"""
+    return bool(SPLIT_PART_RE.match(name))
+
+def download_version(version, select=None, stream_extract=None, cancel_event=None):
+    """Find and download every file of version, return True if all of them succeeded
+
+    select(name) limits the download to part of the files; stream_extract
+    overrides the [download] stream_extract setting. Setting cancel_event
+    stops the downloads (and streaming extraction) early.
+    """
+    settings = get_settings()
+    artifacts = find_download_links(version)
+
+    if not artifacts:
+        print("No files found to download. Please check the version and try again.\n")
+        return False
+
+    if select:
+        artifacts = [a for a in artifacts if select(artifact_name(a))]
+        if not artifacts:
+            print("None of the files of this version were selected, nothing to download.")
+            return True
+
+    print(f"\nFound {len(artifacts)} files to download. Starting download...\n")
+
+    os.makedirs(output_dir, exist_ok=True)
+    session = make_download_session()
     try:
-        filename = os.path.basename(urlparse(url).path)
-        if not filename:
-            raise ValueError("Invalid download URL, unable to parse filename.")
-
-        output_path = os.path.join(output_dir, filename)
-
-        curl_cmd = [
-            "curl",
-            "-u", f"{artifactory_user}:{artifactory_token}",
-            "-o", output_path,
-            url
-        ]
-
-        print(f"[{index}/{total}] Downloading: {url}")
-        print(f"    Saving to: {output_path}")
-        subprocess.run(curl_cmd, check=True)
-        print("    Download completed.\n")
+        scheduler = DownloadScheduler(lambda: make_downloader(session), workers=settings.workers,
+                                      max_retries=settings.retries, cache=get_artifact_cache())
+        if settings.stream_extract if stream_extract is None else stream_extract:
+            results = download_and_stream_extract(artifacts, scheduler, cancel_event)
+        else:
+            results = scheduler.run(artifacts, output_dir, cancel_event)
+    finally:
+        session.close()
+
+    failed = [url for url, ok in results.items() if not ok]
+    if not failed:
+        print("All files downloaded successfully. Program finished.")
         return True
 
-    except subprocess.CalledProcessError as e:
-        print(f"    Download failed: {e}\n")
-    except Exception as e:
-        print(f"    Error: {e}\n")
+    # The resolved URLs may be stale, search again on the next attempt
+    get_search_cache().invalidate(version)
+    print("\nSome files failed to download:")
+    for url in failed:
+        print(f"    {url}")
+    print("Please try again.\n")
     return False
 
-def main():
-    while True:
-        version = get_version()
-        download_urls = find_download_links(version)
+def prefetch_version(version, cancel_event=None):
+    """Download the files of version into the artifact cache only, return True on success
 
-        if not download_urls:
-            print("No files found to download. Please check the version and try again.\n")
-            continue
-
-        print(f"\nFound {len(download_urls)} files to download. Starting download...\n")
-
-        all_success = True
-        for idx, url in enumerate(download_urls, start=1):
-            success = download_file(url, idx, len(download_urls))
-            if not success:
-                all_success = False
-                break
+    Used to fetch the next version while the current one is flashing; the
+    download directory and extracted images are not touched.
+    """
+    settings = get_settings()
+    artifacts = find_download_links(version)
+    if not artifacts:
+        return False
+    cache = get_artifact_cache()
+    missing = [a for a in artifacts if not cache.contains(a)]
+    print(f"Prefetching {len(missing)} of {len(artifacts)} files of version {version} into the cache...")
+    if not missing:
+        return True
+    os.makedirs(prefetch_dir, exist_ok=True)
+    session = make_download_session()
+    try:
+        scheduler = DownloadScheduler(lambda: make_downloader(session), workers=settings.workers,
+                                      max_retries=settings.retries, cache=cache)
+        results = scheduler.run(missing, prefetch_dir, cancel_event)
+    finally:
+        session.close()
+    # The cache keeps its own link to every verified file
+    for artifact in missing:
+        path = os.path.join(prefetch_dir, artifact_name(artifact))
+        if os.path.exists(path):
+            os.remove(path)
+    return bool(results) and all(results.values())
 
-        if all_success:
-            print("All files downloaded successfully. Program finished.")
+def main(config_path=CONFIG_PATH):
+    """Ask for a version until all of its files are downloaded"""
+    configure(config_path=config_path)
+    while True:
+        if download_version(get_version()):
             return
-        else:
-            print("\nSome files failed to download. Please try again.\n")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if "--clear-search-cache" in sys.argv:
+        configure()
+        get_search_cache().invalidate()
+        print("Search cache cleared.")
+    else:
+        main()
@@ -0,0 +1,94 @@
+import os
+import json
+import threading
+
+STATE_SUFFIX = ".json"
+
+
+class DownloadState:
+    """Sidecar record of the byte ranges already written to a partial download"""
+
+    def __init__(self, path, url, size, etag=None, checksum=None, completed=None):
+        self.path = path
+        self.url = url
+        self.size = size
+        self.etag = etag
+        self.checksum = checksum
+        self.completed = self._merge(completed or [])
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        """Return the saved state at path, or None if missing or unreadable"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return cls(path, data["url"], data["size"], data.get("etag"),
+                       data.get("checksum"), data.get("completed"))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def matches(self, url, size, etag=None, checksum=None):
+        """True if the partial file belongs to the same remote artifact"""
+        if self.url != url or self.size != size:
+            return False
+        if etag and self.etag and etag != self.etag:
+            return False
+        if checksum and self.checksum and checksum != self.checksum:
+            return False
+        return True
+
+    def completed_bytes(self):
+        return sum(end - start + 1 for start, end in self.completed)
+
+    def missing_ranges(self):
+        """Return the inclusive (start, end) ranges that are not yet written"""
+        missing = []
+        position = 0
+        for start, end in self.completed:
+            if start > position:
+                missing.append((position, start - 1))
+            position = max(position, end + 1)
+        if position < self.size:
+            missing.append((position, self.size - 1))
+        return missing
+
+    def add_range(self, start, end):
+        """Record [start, end] as written and persist the state"""
+        with self._lock:
+            self.completed = self._merge(self.completed + [[start, end]])
+            self._save_locked()
+
+    def save(self):
+        with self._lock:
+            self._save_locked()
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _save_locked(self):
+        data = {
+            "url": self.url,
+            "size": self.size,
+            "etag": self.etag,
+            "checksum": self.checksum,
+            "completed": self.completed,
+        }
+        # Write to a temp file and rename so a crash never leaves a torn state file
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _merge(ranges):
+        merged = []
+        for start, end in sorted([int(s), int(e)] for s, e in ranges):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
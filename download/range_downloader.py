@@ -0,0 +1,218 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from download.download_state import DownloadState, STATE_SUFFIX
+
+DEFAULT_CONNECTIONS = 8
+CHUNK_SIZE = 32 * 1024 * 1024  # Size of one HTTP Range request
+READ_SIZE = 1024 * 1024        # Size of one socket read / file write
+PROGRESS_INTERVAL = 2.0        # Seconds between progress lines
+PART_SUFFIX = ".part"          # In-flight data, renamed to the final name when complete
+
+
+class DownloadCancelled(Exception):
+    """Raised from a download whose cancel event was set; the partial file is kept for resuming"""
+
+
+class BandwidthLimiter:
+    """Token bucket shared by every connection to cap total download bandwidth"""
+
+    def __init__(self, bytes_per_second):
+        self.rate = float(bytes_per_second or 0)
+        self.capacity = max(self.rate, READ_SIZE)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, nbytes):
+        """Block until nbytes may be transferred without exceeding the rate"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= nbytes
+            deficit = -self.tokens
+        if deficit > 0:
+            time.sleep(deficit / self.rate)
+
+
+def make_session(pool_size=DEFAULT_CONNECTIONS):
+    """Return a requests.Session that keeps up to pool_size connections open to the server"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, int(pool_size)))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class RangeDownloader:
+    """Download a file over several concurrent HTTP Range connections
+
+    A session passed in is shared, e.g. by every download of a version,
+    and is left open; the caller closes it.
+    """
+
+    def __init__(self, auth=None, connections=DEFAULT_CONNECTIONS, chunk_size=CHUNK_SIZE,
+                 proxies=None, session=None, timeout=60, limiter=None):
+        self.connections = max(1, int(connections))
+        self.chunk_size = max(READ_SIZE, int(chunk_size))
+        self.timeout = timeout
+        self.limiter = limiter
+
+        if session is None:
+            session = make_session(self.connections)
+        if auth:
+            session.auth = auth
+        if proxies:
+            session.proxies.update(proxies)
+        self.session = session
+
+        self._lock = threading.Lock()
+        self._done_bytes = 0
+        self._last_report = 0.0
+        self._label = ""
+        self._cancel_event = None
+
+    def probe(self, url):
+        """Return (size, accepts_ranges, etag) for url using a HEAD request"""
+        response = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+        response.raise_for_status()
+        size = response.headers.get("Content-Length")
+        size = int(size) if size and size.isdigit() else None
+        accepts_ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+        etag = response.headers.get("ETag")
+        return size, accepts_ranges, etag
+
+    def plan_ranges(self, missing):
+        """Split inclusive (start, end) ranges into pieces of at most chunk_size"""
+        return [(start, min(start + self.chunk_size, end + 1) - 1)
+                for first, end in missing
+                for start in range(first, end + 1, self.chunk_size)]
+
+    def download(self, url, output_path, checksum=None, cancel_event=None):
+        """Download url into output_path, return the number of bytes written
+
+        Data is written to "<output_path>.part" with a "<output_path>.part.json"
+        sidecar recording finished ranges, so an interrupted download resumes
+        where it stopped. The partial file is discarded if the remote size,
+        ETag or checksum no longer match the sidecar. Setting cancel_event
+        stops every connection with DownloadCancelled.
+        """
+        self._cancel_event = cancel_event
+        size, accepts_ranges, etag = self.probe(url)
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        part_path = output_path + PART_SUFFIX
+        state_path = part_path + STATE_SUFFIX
+
+        self._done_bytes = 0
+        self._label = os.path.basename(output_path)
+        start_time = time.monotonic()
+        self._last_report = start_time
+
+        state = DownloadState.load(state_path)
+        if state and (not os.path.exists(part_path) or not state.matches(url, size, etag, checksum)):
+            print(f"    [INFO] {self._label}: remote artifact changed, discarding partial download.")
+            self._discard(part_path, state_path)
+            state = None
+
+        if not size or not accepts_ranges or self.connections == 1:
+            if not accepts_ranges:
+                print(f"    [INFO] {self._label}: server does not accept byte ranges, using a single stream.")
+            if state:
+                self._discard(part_path, state_path)
+            written = self._download_single(url, part_path, size, start_time)
+        else:
+            if state is None:
+                self._preallocate(part_path, size)
+                state = DownloadState(state_path, url, size, etag, checksum)
+                state.save()
+            elif state.completed_bytes():
+                print(f"    [INFO] {self._label}: resuming, {state.completed_bytes() / 1e6:.1f} of "
+                      f"{size / 1e6:.1f} MB already downloaded")
+            ranges = self.plan_ranges(state.missing_ranges())
+            workers = max(1, min(self.connections, len(ranges)))
+            print(f"    [INFO] {self._label}: downloading {len(ranges)} chunks over {workers} connections")
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(self._download_range, url, part_path, start, end, start_time, state)
+                           for start, end in ranges]
+                for future in as_completed(futures):
+                    future.result()
+            written = self._done_bytes
+
+        os.replace(part_path, output_path)
+        if state:
+            state.remove()
+
+        elapsed = max(time.monotonic() - start_time, 1e-6)
+        print(f"    {self._label}: downloaded {written / 1e6:.1f} MB in {elapsed:.1f}s "
+              f"({written / 1e6 / elapsed:.1f} MB/s)")
+        return written
+
+    def _discard(self, part_path, state_path):
+        for path in (part_path, state_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _preallocate(self, output_path, size):
+        with open(output_path, "wb") as f:
+            f.truncate(size)
+
+    def _download_range(self, url, output_path, start, end, start_time, state=None):
+        headers = {"Range": f"bytes={start}-{end}"}
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise IOError(f"Server ignored range request for bytes {start}-{end}")
+            offset = start
+            with open(output_path, "r+b") as f:
+                f.seek(start)
+                for data in response.iter_content(chunk_size=READ_SIZE):
+                    if not data:
+                        continue
+                    f.write(data)
+                    offset += len(data)
+                    self._add_progress(len(data), start_time)
+                # The range is only recorded once its bytes are durable on disk
+                f.flush()
+                os.fsync(f.fileno())
+        if offset != end + 1:
+            raise IOError(f"Incomplete range {start}-{end}: received {offset - start} bytes")
+        if state:
+            state.add_range(start, end)
+
+    def _download_single(self, url, output_path, size, start_time):
+        written = 0
+        with self.session.get(url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            with open(output_path, "wb") as f:
+                for data in response.iter_content(chunk_size=READ_SIZE):
+                    if not data:
+                        continue
+                    f.write(data)
+                    written += len(data)
+                    self._add_progress(len(data), start_time)
+        if size and written != size:
+            raise IOError(f"Incomplete download: expected {size} bytes, received {written}")
+        return written
+
+    def _add_progress(self, nbytes, start_time):
+        if self._cancel_event is not None and self._cancel_event.is_set():
+            raise DownloadCancelled(f"{self._label}: download cancelled")
+        if self.limiter:
+            self.limiter.consume(nbytes)
+        with self._lock:
+            self._done_bytes += nbytes
+            now = time.monotonic()
+            if now - self._last_report < PROGRESS_INTERVAL:
+                return
+            self._last_report = now
+            done = self._done_bytes
+        elapsed = max(now - start_time, 1e-6)
+        print(f"    [PROGRESS] {self._label}: {done / 1e6:.1f} MB ({done / 1e6 / elapsed:.1f} MB/s)")
@@ -0,0 +1,86 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+from download.artifact_cache import record_checksum
+
+DEFAULT_WORKERS = 4
+DEFAULT_RETRIES = 3
+RETRY_DELAY = 5
+
+
+class DownloadScheduler:
+    """Download independent artifacts concurrently, retrying each one on its own"""
+
+    def __init__(self, downloader_factory, workers=DEFAULT_WORKERS,
+                 max_retries=DEFAULT_RETRIES, retry_delay=RETRY_DELAY, cache=None):
+        # downloader_factory() must return a fresh RangeDownloader-like object per attempt
+        self.downloader_factory = downloader_factory
+        self.cache = cache
+        self.workers = max(1, int(workers))
+        self.max_retries = max(1, int(max_retries))
+        self.retry_delay = retry_delay
+
+    def run(self, artifacts, output_dir, cancel_event=None):
+        """Download every artifact into output_dir, return {url: True/False}
+
+        Each artifact is a URL string or a dict with at least "url" and
+        optionally "sha256"/"sha1" used for the artifact cache. Once
+        cancel_event is set, running downloads stop and the remaining
+        artifacts fail without being tried.
+        """
+        artifacts = [{"url": a} if isinstance(a, str) else a for a in artifacts]
+        cancel_event = cancel_event or threading.Event()
+        results = {}
+        if not artifacts:
+            return results
+
+        start_time = time.monotonic()
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(artifacts))) as pool:
+            futures = {pool.submit(self._download_with_retry, artifact, output_dir, index, len(artifacts),
+                                   cancel_event):
+                       artifact["url"]
+                       for index, artifact in enumerate(artifacts, start=1)}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+
+        elapsed = time.monotonic() - start_time
+        done = sum(1 for ok in results.values() if ok)
+        print(f"\n[INFO] {done}/{len(artifacts)} files ready in {elapsed:.1f}s")
+        return results
+
+    def _download_with_retry(self, artifact, output_dir, index, total, cancel_event):
+        url = artifact["url"]
+        filename = os.path.basename(urlparse(url).path)
+        if not filename:
+            print(f"[{index}/{total}] Invalid download URL, unable to parse filename: {url}")
+            return False
+        output_path = os.path.join(output_dir, filename)
+
+        if self.cache and self.cache.fetch(artifact, output_path):
+            record_checksum(output_path, artifact)
+            print(f"[{index}/{total}] {filename}: found in local cache, skipping download.")
+            return True
+
+        for attempt in range(1, self.max_retries + 1):
+            if cancel_event.is_set():
+                print(f"[{index}/{total}] {filename}: download cancelled.")
+                return False
+            print(f"[{index}/{total}] Downloading: {url} (attempt {attempt}/{self.max_retries})")
+            print(f"    Saving to: {output_path}")
+            try:
+                self.downloader_factory().download(url, output_path, checksum=artifact.get("sha256"),
+                                                   cancel_event=cancel_event)
+                if self.cache:
+                    self.cache.store(artifact, output_path)
+                record_checksum(output_path, artifact)
+                print(f"    {filename}: download completed.")
+                return True
+            except Exception as e:
+                print(f"    {filename}: download failed: {e}")
+                if attempt < self.max_retries and not cancel_event.is_set():
+                    print(f"    {filename}: retrying in {self.retry_delay} seconds...")
+                    cancel_event.wait(self.retry_delay)
+        return False
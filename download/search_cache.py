@@ -0,0 +1,57 @@
+import os
+import json
+import time
+import threading
+
+DEFAULT_SEARCH_CACHE_FILE = os.path.join("utils", "cache", "search_cache.json")
+DEFAULT_TTL_MINUTES = 60
+
+
+class SearchCache:
+    """Persistent map of version -> resolved artifact list with a time-to-live"""
+
+    def __init__(self, path=DEFAULT_SEARCH_CACHE_FILE, ttl_seconds=DEFAULT_TTL_MINUTES * 60):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def get(self, version, allow_stale=False):
+        """Return the cached artifacts for version, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(version)
+        if not entry:
+            return None
+        age = time.time() - entry.get("resolved_at", 0)
+        if age > self.ttl_seconds and not allow_stale:
+            return None
+        return entry.get("artifacts")
+
+    def put(self, version, artifacts):
+        with self._lock:
+            self._entries[version] = {"resolved_at": time.time(), "artifacts": artifacts}
+            self._save_locked()
+
+    def invalidate(self, version=None):
+        """Drop one version, or every entry when version is None"""
+        with self._lock:
+            if version is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(version, None)
+            self._save_locked()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save_locked(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, indent=2)
+        os.replace(tmp_path, self.path)
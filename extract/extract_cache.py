@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+
+from download.artifact_cache import link_or_copy, recorded_checksum
+
+DEFAULT_EXTRACT_CACHE_DIR = os.path.join("utils", "cache", "extracted")
+DEFAULT_MAX_ENTRIES = 6  # Roughly two release versions of IVI, METER and RELEASE trees
+COMPLETE_MARKER = ".complete"
+HASH_READ_SIZE = 4 * 1024 * 1024
+
+
+def archive_checksum(paths):
+    """sha256 of the concatenation of paths (one archive or its ordered split parts)"""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_READ_SIZE), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def archive_key(paths):
+    """Cache key of an archive (file or ordered split parts)
+
+    Built from the Artifactory checksums recorded at download time, so a
+    multi-GB archive is not read again just to find its entry. Only
+    archives without recorded checksums are hashed.
+    """
+    recorded = [recorded_checksum(path) for path in paths]
+    if all(algorithm for algorithm, _ in recorded):
+        joined = ",".join(f"{algorithm}:{digest}" for algorithm, digest in recorded)
+        return hashlib.sha256(joined.encode()).hexdigest()
+    return archive_checksum(paths)
+
+
+def materialize_tree(src, dst):
+    """Recreate the tree at src under dst using hardlinks, copying across filesystems"""
+    if os.path.exists(dst):
+        shutil.rmtree(dst)
+    shutil.copytree(src, dst, copy_function=link_or_copy, symlinks=True)
+
+
+class ExtractCache:
+    """Extracted archive trees kept per archive checksum
+
+    Each entry is <cache_dir>/<sha256>/<base_name>/... plus a completion
+    marker written only after extraction finished, so an interrupted
+    extraction is never reused. Working directories are materialized
+    from an entry with hardlinks, which takes seconds instead of minutes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_EXTRACT_CACHE_DIR, max_entries=DEFAULT_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def lookup(self, key):
+        """Return the extracted tree for key, or None if not completely extracted"""
+        marker = os.path.join(self.entry_dir(key), COMPLETE_MARKER)
+        try:
+            with open(marker, "r", encoding="utf-8") as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return None
+        tree = os.path.join(self.entry_dir(key), info.get("base_name", ""))
+        if not os.path.isdir(tree):
+            return None
+        os.utime(marker)
+        return tree
+
+    def staging_dir(self, key):
+        """Return an empty directory to extract into before commit()"""
+        path = f"{self.entry_dir(key)}.{os.getpid()}.tmp"
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+        return path
+
+    def commit(self, key, staging, base_name):
+        """Mark a staged extraction complete and move it into place"""
+        with open(os.path.join(staging, COMPLETE_MARKER), "w", encoding="utf-8") as f:
+            json.dump({"base_name": base_name, "created": time.time()}, f)
+        entry = self.entry_dir(key)
+        if os.path.exists(entry):
+            shutil.rmtree(entry)
+        os.replace(staging, entry)
+        return os.path.join(entry, base_name)
+
+    def evict(self, keep=()):
+        """Delete the least recently used entries beyond max_entries"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            marker = os.path.join(self.cache_dir, name, COMPLETE_MARKER)
+            if name in keep or not os.path.isfile(marker):
+                continue
+            entries.append((os.path.getmtime(marker), name))
+        surplus = len(entries) + len(keep) - self.max_entries
+        for _, name in sorted(entries)[:max(0, surplus)]:
+            shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            print(f"[INFO] Evicted extraction cache entry {name}")
@@ -0,0 +1,126 @@
+import os
+import json
+
+MANIFEST_FILE = ".image_manifest.json"
+
+_manifests = {}
+
+
+class ImageManifest:
+    """Index of every file and directory name under an images root
+
+    Built with a single os.walk and persisted as JSON in the root. It is
+    reused as long as the mtime of every indexed directory is unchanged,
+    since adding, removing or renaming an entry updates its parent's mtime.
+    Paths are kept in walk order, so lookups return the same first match
+    as the os.walk searches they replace.
+    """
+
+    def __init__(self, root, files, dirs, dir_mtimes, skip_dirs=()):
+        self.root = os.path.abspath(root)
+        self.files = files            # basename -> [relative parent dir, ...]
+        self.dirs = dirs              # basename -> [relative parent dir, ...]
+        self.dir_mtimes = dir_mtimes  # relative dir -> st_mtime_ns
+        self.skip_dirs = tuple(skip_dirs)
+
+    @classmethod
+    def scan(cls, root, skip_dirs=()):
+        root = os.path.abspath(root)
+        files, dirs, dir_mtimes = {}, {}, {}
+        for dirpath, dirnames, filenames in os.walk(root):
+            if dirpath == root:
+                dirnames[:] = [d for d in dirnames if d not in skip_dirs]
+            rel = os.path.relpath(dirpath, root)
+            try:
+                dir_mtimes[rel] = os.stat(dirpath).st_mtime_ns
+            except OSError:
+                continue
+            for name in dirnames:
+                dirs.setdefault(name, []).append(rel)
+            for name in filenames:
+                if dirpath == root and name == MANIFEST_FILE:
+                    continue
+                files.setdefault(name, []).append(rel)
+        return cls(root, files, dirs, dir_mtimes, skip_dirs)
+
+    @classmethod
+    def load(cls, root):
+        root = os.path.abspath(root)
+        try:
+            with open(os.path.join(root, MANIFEST_FILE), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return cls(root, data["files"], data["dirs"], data["dir_mtimes"], data.get("skip_dirs", ()))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def is_current(self):
+        """True if no indexed directory has changed since the scan"""
+        for rel, mtime in self.dir_mtimes.items():
+            try:
+                if os.stat(os.path.join(self.root, rel)).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+        return bool(self.dir_mtimes)
+
+    def save(self):
+        path = os.path.join(self.root, MANIFEST_FILE)
+        try:
+            # Create the file first and record the root mtime afterwards, then
+            # rewrite it in place so saving does not invalidate the manifest.
+            if not os.path.exists(path):
+                open(path, "w").close()
+                self.dir_mtimes["."] = os.stat(self.root).st_mtime_ns
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "files": self.files,
+                    "dirs": self.dirs,
+                    "dir_mtimes": self.dir_mtimes,
+                    "skip_dirs": list(self.skip_dirs),
+                }, f)
+        except OSError as e:
+            print(f"[WARN] Could not save image manifest in {self.root}: {e}")
+
+    def _paths(self, table, name):
+        return [os.path.normpath(os.path.join(self.root, rel, name)) for rel in table.get(name, [])]
+
+    def _under(self, paths, under):
+        if under is None:
+            return paths
+        prefix = os.path.abspath(under) + os.sep
+        return [p for p in paths if p.startswith(prefix)]
+
+    def find_file(self, name, under=None):
+        """Return the first file called name (optionally below under), or None"""
+        paths = self._under(self._paths(self.files, name), under)
+        return paths[0] if paths else None
+
+    def find_dir(self, name, under=None):
+        """Return the first directory called name (optionally below under), or None"""
+        paths = self._under(self._paths(self.dirs, name), under)
+        return paths[0] if paths else None
+
+    def find_files(self, predicate, under=None):
+        """Return every file whose basename satisfies predicate, in walk order"""
+        matches = []
+        for name in self.files:
+            if predicate(name):
+                for rel in self.files[name]:
+                    matches.append((rel, name))
+        order = {rel: i for i, rel in enumerate(self.dir_mtimes)}
+        matches.sort(key=lambda m: order.get(m[0], len(order)))
+        return self._under([os.path.normpath(os.path.join(self.root, rel, name)) for rel, name in matches], under)
+
+
+def get_manifest(root, skip_dirs=(), refresh=False):
+    """Return a current manifest for root, loading or rescanning only when needed"""
+    root = os.path.abspath(root)
+    manifest = None if refresh else _manifests.get(root)
+    if manifest is None and not refresh:
+        manifest = ImageManifest.load(root)
+    if manifest is None or manifest.skip_dirs != tuple(skip_dirs) or not manifest.is_current():
+        manifest = ImageManifest.scan(root, skip_dirs)
+        if os.path.isdir(root):
+            manifest.save()
+    _manifests[root] = manifest
+    return manifest
@@ -0,0 +1,146 @@
+import os
+import queue
+import shutil
+import threading
+import subprocess
+import zlib
+from contextlib import contextmanager
+
+READ_SIZE = 4 * 1024 * 1024
+QUEUE_DEPTH = 8  # Decompressed blocks buffered between inflater and consumer
+
+
+def find_pigz():
+    """Return the path of pigz/unpigz if installed, else None"""
+    return shutil.which("pigz") or shutil.which("unpigz")
+
+
+def _feed_files(paths, sink):
+    """Write the concatenation of paths into sink, closing it at the end"""
+    try:
+        for path in paths:
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, sink, READ_SIZE)
+    except (BrokenPipeError, OSError):
+        pass
+    finally:
+        try:
+            sink.close()
+        except OSError:
+            pass
+
+
+class ThreadedGzipReader:
+    """Inflate a (possibly split) gzip stream in a background thread
+
+    zlib releases the GIL while inflating, so decompression overlaps with
+    whatever the consumer (tarfile writing members to disk) is doing.
+    """
+
+    def __init__(self, paths):
+        self._queue = queue.Queue(maxsize=QUEUE_DEPTH)
+        self._block = b""
+        self._pos = 0
+        self._error = None
+        self._eof = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._inflate, args=(list(paths),), daemon=True)
+        self._thread.start()
+
+    def _inflate(self, paths):
+        try:
+            decompressor = zlib.decompressobj(wbits=31)
+            member_open = False
+            for path in paths:
+                with open(path, "rb") as f:
+                    for block in iter(lambda: f.read(READ_SIZE), b""):
+                        while block:
+                            member_open = True
+                            data = decompressor.decompress(block)
+                            if data:
+                                self._put(data)
+                            if decompressor.eof:
+                                # Multi-member gzip: continue with a fresh decompressor
+                                block = decompressor.unused_data
+                                decompressor = zlib.decompressobj(wbits=31)
+                                member_open = False
+                            else:
+                                block = b""
+                        if self._stop.is_set():
+                            return
+            if member_open:
+                raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+        except Exception as e:
+            self._error = e
+        finally:
+            self._put(None)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def read(self, size=-1):
+        chunks = []
+        remaining = size
+        while size < 0 or remaining > 0:
+            if self._pos >= len(self._block):
+                if self._eof:
+                    break
+                item = self._queue.get()
+                if item is None:
+                    self._eof = True
+                    if self._error:
+                        raise IOError(f"Decompression failed: {self._error}")
+                    break
+                self._block, self._pos = item, 0
+                continue
+            end = len(self._block) if size < 0 else min(len(self._block), self._pos + remaining)
+            chunks.append(self._block[self._pos:end])
+            remaining -= end - self._pos
+            self._pos = end
+        return b"".join(chunks)
+
+    def close(self):
+        self._stop.set()
+
+
+@contextmanager
+def open_gzip_stream(paths):
+    """Yield a readable stream of the decompressed concatenation of paths
+
+    pigz is used when installed; otherwise decompression runs in a
+    background thread. The stream is meant for tarfile mode 'r|'.
+    """
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    pigz = find_pigz()
+    if not pigz:
+        reader = ThreadedGzipReader(paths)
+        try:
+            yield reader
+        finally:
+            reader.close()
+        return
+
+    creationflags = subprocess.CREATE_NO_WINDOW if os.name == "nt" else 0
+    process = subprocess.Popen([pigz, "-dc"], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               creationflags=creationflags)
+    feeder = threading.Thread(target=_feed_files, args=(paths, process.stdin), daemon=True)
+    feeder.start()
+    try:
+        yield process.stdout
+        # Drain trailing padding so pigz does not fail with a broken pipe
+        while process.stdout.read(READ_SIZE):
+            pass
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        process.stdout.close()
+        feeder.join()
+        returncode = process.wait()
+    if returncode != 0:
+        raise IOError(f"pigz exited with code {returncode}")
@@ -0,0 +1,154 @@
+import os
+import re
+import json
+import fnmatch
+import tarfile
+
+from extract.parallel_gzip import open_gzip_stream
+
+INDEX_FILE = ".member_index.json"
+
+# Members the flash flow uses; everything else is left in the archive until asked for
+REQUIRED_BASENAMES = ("rawprogram0.xml", "prog_firehose_ddr.elf")
+REQUIRED_BAT_PATTERN = "fastboot_nscdc_*_blank_flash.bat"
+REQUIRED_DIRECTORY = "sail_nor"
+
+# File names referenced from a fastboot bat script, e.g. "fastboot flash boot_a %~dp0boot.img"
+BAT_REFERENCE_RE = re.compile(r"[\w.\-]+\.(?:img|bin|elf|mbn|dtbo|ubi|mbr|xml|melf)\b", re.IGNORECASE)
+BAT_VARIABLE_RE = re.compile(r"%~[a-z]*\d|%\w+%", re.IGNORECASE)
+
+
+def is_required(name):
+    """True if an archive member is needed by the QFIL, fastboot or MCU stages"""
+    parts = name.replace("\\", "/").split("/")
+    base = parts[-1]
+    if REQUIRED_DIRECTORY in parts[:-1] or base == REQUIRED_DIRECTORY:
+        return True
+    if base in REQUIRED_BASENAMES or fnmatch.fnmatch(base, REQUIRED_BAT_PATTERN):
+        return True
+    return base.endswith(".s19") and ("NCDCIVI" in base or "NCDCMETER" in base)
+
+
+def bat_references(bat_path):
+    """Return the file names a fastboot bat script refers to"""
+    with open(bat_path, "r", encoding="utf-8", errors="ignore") as f:
+        text = BAT_VARIABLE_RE.sub(" ", f.read())
+    return {match.group(0) for match in BAT_REFERENCE_RE.finditer(text)}
+
+
+def _member_type(member):
+    if member.isdir():
+        return "dir"
+    if member.issym() or member.islnk():
+        return "link"
+    return "file"
+
+
+def _load_index(target_dir):
+    with open(os.path.join(target_dir, INDEX_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_index(target_dir, index):
+    path = os.path.join(target_dir, INDEX_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(path + ".tmp", path)
+
+
+def _extract_matching(sources, target_dir, wanted, members=None):
+    """Stream the archive once, extracting members for which wanted(name) is true
+
+    If members is a dict it is filled with the index of every member seen.
+    """
+    extracted = []
+    with open_gzip_stream(sources) as stream:
+        with tarfile.open(fileobj=stream, mode="r|") as tar:
+            for member in tar:
+                if members is not None:
+                    members[member.name] = {"type": _member_type(member), "size": member.size}
+                if not wanted(member.name):
+                    continue
+                try:
+                    tar.extract(member, path=target_dir)
+                    extracted.append(member.name)
+                except (OSError, tarfile.TarError, KeyError) as e:
+                    # e.g. a hardlink whose target was not selected
+                    print(f"[WARN] Could not extract {member.name}: {e}")
+    return extracted
+
+
+def extract_selective(sources, extract_to):
+    """Extract only the flash-flow members of a .tar.gz (file or ordered split parts)
+
+    The first pass extracts the required members, including the fastboot
+    bat, and builds the member index; a second pass extracts only the
+    images that bat refers to. The index is saved next to the extracted
+    files, together with the source paths, so further members can be
+    pulled later with ensure_members(). Sources are kept for that reason.
+    """
+    sources = [sources] if isinstance(sources, str) else list(sources)
+    base_name = os.path.basename(sources[0]).split(".tar.gz")[0]
+    target_dir = os.path.join(extract_to, base_name)
+    os.makedirs(target_dir, exist_ok=True)
+
+    print(f"Selectively extracting {base_name} to {target_dir}...")
+    members = {}
+    extracted = _extract_matching(sources, target_dir, is_required, members)
+    _save_index(target_dir, {
+        "sources": [os.path.abspath(p) for p in sources],
+        "members": members,
+        "extracted": extracted,
+    })
+
+    # Images referenced by the fastboot bat are only known once the bat is on disk
+    references = set()
+    for name in extracted:
+        if fnmatch.fnmatch(os.path.basename(name), REQUIRED_BAT_PATTERN):
+            references |= bat_references(os.path.join(target_dir, name))
+    if references:
+        extracted = extracted + ensure_members(target_dir, lambda name: os.path.basename(name) in references)
+    print(f"Extracted {len(extracted)} of {len(members)} members from {base_name}")
+    return target_dir
+
+
+def ensure_members(target_dir, wanted):
+    """Extract any not-yet-extracted members matching wanted(name), return their names"""
+    try:
+        index = _load_index(target_dir)
+    except (OSError, ValueError):
+        return []
+    done = set(index["extracted"])
+    missing = {name for name in index["members"] if name not in done and wanted(name)}
+    if not missing:
+        return []
+    if not all(os.path.exists(p) for p in index["sources"]):
+        print(f"[WARN] Archive for {target_dir} is gone, cannot extract {len(missing)} more members")
+        return []
+
+    print(f"Extracting {len(missing)} more members into {target_dir}...")
+    extracted = _extract_matching(index["sources"], target_dir, lambda name: name in missing)
+    index["extracted"] = sorted(done | set(extracted))
+    _save_index(target_dir, index)
+    return extracted
+
+
+def pull_matching(images_root, match):
+    """Extract members whose basename passes match() from any selectively extracted archive under images_root
+
+    Returns the path of the first extracted match, or None.
+    """
+    if not os.path.isdir(images_root):
+        return None
+    for entry in os.listdir(images_root):
+        target_dir = os.path.join(images_root, entry)
+        if not os.path.isfile(os.path.join(target_dir, INDEX_FILE)):
+            continue
+        for name in ensure_members(target_dir, lambda n: match(os.path.basename(n))):
+            return os.path.join(target_dir, name)
+    return None
+
+
+def pull_on_demand(images_root, filename):
+    """Extract members named filename, see pull_matching"""
+    return pull_matching(images_root, lambda base: base == filename)
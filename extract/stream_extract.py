@@ -0,0 +1,116 @@
+import io
+import os
+import time
+import tarfile
+
+from download.download_state import DownloadState, STATE_SUFFIX
+from download.range_downloader import PART_SUFFIX
+
+READ_SIZE = 1024 * 1024
+POLL_INTERVAL = 0.2
+STALL_TIMEOUT = 600  # Give up if no new bytes arrive for this many seconds
+
+
+class GrowingPartsReader(io.RawIOBase):
+    """Read split archive parts as one stream while they are still downloading
+
+    For each part the reader serves the bytes that are already on disk:
+    the whole file once it has its final name, otherwise the contiguous
+    prefix of "<part>.part" recorded in its download state. It waits for
+    more data until done_event is set and the part is still incomplete,
+    and stops with an IOError once cancel_event is set.
+    """
+
+    def __init__(self, part_paths, done_event=None, poll_interval=POLL_INTERVAL,
+                 stall_timeout=STALL_TIMEOUT, cancel_event=None):
+        super().__init__()
+        self.part_paths = list(part_paths)
+        self.done_event = done_event
+        self.cancel_event = cancel_event
+        self.poll_interval = poll_interval
+        self.stall_timeout = stall_timeout
+        self.index = 0
+        self.offset = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        last_progress = time.monotonic()
+        while self.index < len(self.part_paths):
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                raise IOError("Streaming extraction cancelled")
+            path = self.part_paths[self.index]
+            source, available, complete = self._available(path)
+
+            if self.offset < available:
+                size = min(len(buffer), available - self.offset, READ_SIZE)
+                # Open per read so the downloader can still rename the part file on Windows
+                try:
+                    with open(source, "rb") as f:
+                        f.seek(self.offset)
+                        data = f.read(size)
+                except FileNotFoundError:
+                    # "<part>.part" was renamed to its final name since _available(), look again
+                    continue
+                buffer[:len(data)] = data
+                self.offset += len(data)
+                return len(data)
+
+            if complete:
+                self.index += 1
+                self.offset = 0
+                continue
+
+            if self.done_event is not None and self.done_event.is_set():
+                # The downloader finished; check once more before declaring the part missing
+                _, available, complete = self._available(path)
+                if not complete and available <= self.offset:
+                    raise IOError(f"Download ended before {os.path.basename(path)} was complete")
+                continue
+            if time.monotonic() - last_progress > self.stall_timeout:
+                raise IOError(f"No data received for {os.path.basename(path)} "
+                              f"in {self.stall_timeout} seconds")
+            time.sleep(self.poll_interval)
+        return 0
+
+    def _available(self, path):
+        """Return (readable_path, bytes_available, complete) for a part"""
+        if os.path.isfile(path):
+            return path, os.path.getsize(path), True
+        part_path = path + PART_SUFFIX
+        state = DownloadState.load(part_path + STATE_SUFFIX)
+        if state and state.completed and state.completed[0][0] == 0:
+            return part_path, state.completed[0][1] + 1, False
+        return part_path, 0, False
+
+
+def stream_extract_parts(part_paths, extract_to, done_event=None, delete_parts=True, cancel_event=None):
+    """Extract a split .tar.gz from its ordered parts without writing a merged file
+
+    With delete_parts=False the parts are left for the caller, e.g. while
+    the downloader may still be storing them in the artifact cache.
+    """
+    first = os.path.basename(part_paths[0])
+    base_name = first.split(".tar.gz")[0]
+    target_dir = os.path.join(extract_to, base_name)
+    os.makedirs(target_dir, exist_ok=True)
+
+    print(f"Streaming extraction of {len(part_paths)} parts to {target_dir}...")
+    start_time = time.monotonic()
+    reader = io.BufferedReader(GrowingPartsReader(part_paths, done_event, cancel_event=cancel_event),
+                               buffer_size=READ_SIZE)
+    with tarfile.open(fileobj=reader, mode="r|gz") as tar:
+        tar.extractall(path=target_dir)
+    print(f"Streaming extraction complete in {time.monotonic() - start_time:.1f}s: {target_dir}")
+
+    if delete_parts:
+        delete_part_files(part_paths)
+    return target_dir
+
+
+def delete_part_files(part_paths):
+    for part in part_paths:
+        if os.path.exists(part):
+            os.remove(part)
+            print(f"Deleted part file {part}")
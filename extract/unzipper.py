@@ -1,13 +1,31 @@
 import os
+import re
+import sys
+import configparser
 import zipfile
 import tarfile
 import shutil
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, wait
+
+# Allow "python extract/unzipper.py" to import sibling packages
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from extract.parallel_gzip import open_gzip_stream
+from extract.extract_cache import ExtractCache, DEFAULT_EXTRACT_CACHE_DIR, archive_key, materialize_tree
+from extract.selective_extract import extract_selective
 
 # Relative paths
 DOWNLOAD_DIR = os.path.join("utils", "downloads")
 EXTRACT_DIR = os.path.join("utils", "extracted")
 
+# Split archive parts as produced by "split": NAME.tar.gz.aa, NAME.tar.gz.ab, ...
+SPLIT_PART_RE = re.compile(r"^(?P<base>.+\.tar\.gz)\.(?P<suffix>[a-z]{2})$")
+EXTRACT_WORKERS = os.cpu_count() or 1
+CANCEL_POLL_INTERVAL = 0.5  # Seconds between checks of the cancel event while archives extract
+
 def unzip_file(zip_path, extract_to):
     zip_name = os.path.splitext(os.path.basename(zip_path))[0]
     target_dir = os.path.join(extract_to, zip_name)
@@ -20,31 +38,71 @@ def unzip_file(zip_path, extract_to):
     return target_dir
 
 def extract_tar_gz(tar_gz_path, extract_to):
-    base_name = os.path.splitext(os.path.splitext(os.path.basename(tar_gz_path))[0])[0]
+    return extract_split_tar_gz([tar_gz_path], extract_to)
+
+def extract_split_tar_gz(parts, extract_to):
+    """Extract a .tar.gz given as one file or as ordered split parts, then delete them"""
+    base_name = os.path.basename(parts[0]).split(".tar.gz")[0]
     target_dir = os.path.join(extract_to, base_name)
     os.makedirs(target_dir, exist_ok=True)
-    print(f"Extracting {tar_gz_path} to {target_dir}...")
-    with tarfile.open(tar_gz_path, 'r:gz') as tar:
-        tar.extractall(path=target_dir)
+    source = parts[0] if len(parts) == 1 else f"{len(parts)} parts of {base_name}.tar.gz"
+    print(f"Extracting {source} to {target_dir}...")
+    with open_gzip_stream(parts) as stream:
+        with tarfile.open(fileobj=stream, mode='r|') as tar:
+            tar.extractall(path=target_dir)
     print(f"Extraction complete: {target_dir}")
-    os.remove(tar_gz_path)  # Delete source file after extraction
-    print(f"Deleted source file {tar_gz_path}")
+    for part in parts:
+        os.remove(part)  # Delete source file after extraction
+        print(f"Deleted source file {part}")
+    return target_dir
+
+def split_part_index(path):
+    """Return the 0-based position of a split part from its .aa/.ab/... suffix"""
+    match = SPLIT_PART_RE.match(os.path.basename(path))
+    if not match:
+        raise ValueError(f"Not a split archive part: {path}")
+    first, second = match.group("suffix")
+    return (ord(first) - ord("a")) * 26 + (ord(second) - ord("a"))
 
-def merge_files(file_parts, output_file):
-    if os.path.exists(output_file):
-        os.remove(output_file)
-    with open(output_file, 'wb') as merged_file:
-        for part in sorted(file_parts):
-            with open(part, 'rb') as part_file:
-                merged_file.write(part_file.read())
-    print(f"Merged files into {output_file}")
+def order_split_parts(file_parts):
+    """Sort parts by suffix and check they run from .aa with no gaps"""
+    ordered = sorted(file_parts, key=split_part_index)
+    for expected, part in enumerate(ordered):
+        if split_part_index(part) != expected:
+            raise ValueError(f"Missing or duplicate split part before {os.path.basename(part)}")
+    return ordered
 
-    # Delete the part files after merging
-    for part in file_parts:
-        os.remove(part)
-        print(f"Deleted part file {part}")
+def archive_base_name(path):
+    name = os.path.basename(path)
+    if name.endswith(".zip"):
+        return os.path.splitext(name)[0]
+    return name.split(".tar.gz")[0]
 
-    return output_file
+def extract_with_cache(func, source, extract_dir, cache_dir):
+    """Extract an archive through the extraction cache and link it into extract_dir
+
+    Archives whose checksum was extracted before are not decompressed
+    again; their cached tree is materialized with hardlinks.
+    """
+    paths = source if isinstance(source, list) else [source]
+    base_name = archive_base_name(paths[0])
+    cache = ExtractCache(cache_dir)
+    key = archive_key(paths)
+
+    tree = cache.lookup(key)
+    if tree:
+        print(f"Reusing cached extraction of {base_name} ({key[:12]})")
+        for path in paths:
+            os.remove(path)
+            print(f"Deleted source file {path}")
+    else:
+        staging = cache.staging_dir(key)
+        func(source, staging)
+        tree = cache.commit(key, staging, base_name)
+
+    materialize_tree(tree, os.path.join(extract_dir, base_name))
+    print(f"Linked {base_name} into {extract_dir}")
+    return key
 
 def clear_extract_dir(extract_dir):
     if os.path.exists(extract_dir):
@@ -59,30 +117,89 @@ def clear_extract_dir(extract_dir):
         os.makedirs(extract_dir)
         print(f"Created extract directory: {extract_dir}")
 
-def find_and_process_all(download_dir, extract_dir):
-    clear_extract_dir(extract_dir)
+def find_and_process_all(download_dir, extract_dir, cache_dir=DEFAULT_EXTRACT_CACHE_DIR, selective=False,
+                         select=None, clear=True, cancel_event=None):
+    """Extract the archives in download_dir (those whose name passes select, if given)
+
+    clear=False keeps what is already in extract_dir, so several calls can
+    fill it side by side. Setting cancel_event stops the worker processes
+    and raises RuntimeError, leaving the archives in download_dir.
+    """
+    archives = [f for f in os.listdir(download_dir)
+                if (f.endswith((".zip", ".tar.gz")) or SPLIT_PART_RE.match(f))
+                and (select is None or select(f))]
+    if not archives:
+        # Nothing new to extract (e.g. already extracted while downloading), keep existing files
+        print(f"No archives found in {download_dir}, keeping {extract_dir} as is.")
+        return
+
+    if clear:
+        clear_extract_dir(extract_dir)
+    os.makedirs(extract_dir, exist_ok=True)
 
-    merged_tar_groups = defaultdict(list)
+    jobs = []
+    split_groups = defaultdict(list)
 
-    for file in os.listdir(download_dir):
+    for file in archives:
         file_path = os.path.join(download_dir, file)
         if file.endswith(".zip"):
-            print(f"Processing zip file: {file_path}")
-            unzip_file(file_path, extract_dir)
+            jobs.append((unzip_file, file_path))
 
-        elif any(file.endswith(ext) for ext in [".tar.gz.aa", ".tar.gz.ab", ".tar.gz.ac", ".tar.gz.ad"]):
-            base = file.split(".tar.gz.")[0] + ".tar.gz"
-            merged_tar_groups[base].append(file_path)
+        elif SPLIT_PART_RE.match(file):
+            base = SPLIT_PART_RE.match(file).group("base")
+            split_groups[base].append(file_path)
 
         elif file.endswith(".tar.gz"):
-            print(f"Processing tar.gz file: {file_path}")
-            extract_tar_gz(file_path, extract_dir)
+            jobs.append((extract_selective if selective else extract_tar_gz, file_path))
+
+    # Split parts are decompressed as one stream, so no merged copy is written
+    for base_name, parts in split_groups.items():
+        jobs.append((extract_selective if selective else extract_split_tar_gz, order_split_parts(parts)))
+
+    # Selective extraction keeps its archives for on-demand pulls, so it bypasses the cache
+    if selective:
+        cache_dir = None
+
+    # Archives are independent: extract them concurrently, one process each
+    workers = max(1, min(len(jobs), EXTRACT_WORKERS))
+    print(f"Extracting {len(jobs)} archives with {workers} worker processes...")
+    failed = 0
+    keys = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if cache_dir:
+            futures = {pool.submit(extract_with_cache, func, source, extract_dir, cache_dir): source
+                       for func, source in jobs}
+        else:
+            futures = {pool.submit(func, source, extract_dir): source for func, source in jobs}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=CANCEL_POLL_INTERVAL)
+            for future in done:
+                try:
+                    keys.append(future.result())
+                except Exception as e:
+                    failed += 1
+                    print(f"[ERROR] Extraction of {futures[future]} failed: {e}")
+            if pending and cancel_event is not None and cancel_event.is_set():
+                # The workers are separate processes that cannot see the event, stop them
+                for future in pending:
+                    future.cancel()
+                for process in list(pool._processes.values()):
+                    process.terminate()
+                raise RuntimeError("Extraction cancelled")
+    if cache_dir:
+        ExtractCache(cache_dir).evict(keep=keys)
+    if failed:
+        raise RuntimeError(f"{failed} of {len(jobs)} archives failed to extract")
 
-    for base_name, parts in merged_tar_groups.items():
-        merged_path = os.path.join(download_dir, base_name)
-        print(f"Merging parts into: {merged_path}")
-        merge_files(parts, merged_path)
-        extract_tar_gz(merged_path, extract_dir)
+def extract_downloads(config_path="config.ini", selective=None, select=None, clear=True, cancel_event=None):
+    """Extract everything in the download directory, selective mode defaults to config.ini"""
+    if selective is None:
+        config = configparser.ConfigParser()
+        config.read(config_path)
+        selective = config.getboolean("extract", "selective", fallback=False)
+    find_and_process_all(DOWNLOAD_DIR, EXTRACT_DIR, selective=selective, select=select, clear=clear,
+                         cancel_event=cancel_event)
 
 if __name__ == "__main__":
-    find_and_process_all(DOWNLOAD_DIR, EXTRACT_DIR)
+    extract_downloads(selective=True if "--selective" in sys.argv else None)
@@ -0,0 +1,198 @@
+import time
+import threading
+from collections import namedtuple
+
+try:
+    import serial.tools.list_ports
+except ImportError:
+    print("Error: The 'pyserial' package is not installed.")
+    print("Please install it using: pip install pyserial")
+    exit(1)
+
+try:
+    import pyudev  # Optional: Linux hotplug notifications
+except ImportError:
+    pyudev = None
+
+from hardware.qualcomm_detector import QUALCOMM_VENDOR_ID, is_edl_port
+
+MODE_EDL = "EDL"
+MODE_NORMAL = "NORMAL"
+
+ATTACH = "attach"
+DETACH = "detach"
+MODE_CHANGE = "mode_change"
+
+MIN_POLL_INTERVAL = 0.1   # Seconds between enumerations right after a change
+MAX_POLL_INTERVAL = 1.0   # Seconds between enumerations when idle
+HOTPLUG_POLL_INTERVAL = 5.0  # Safety-net interval when hotplug events are available
+
+# key identifies a unit across re-enumeration, see unit_key()
+Device = namedtuple("Device", "key port mode vid pid serial_number location", defaults=(None,))
+DeviceEvent = namedtuple("DeviceEvent", "kind device previous")
+
+
+def unit_key(port):
+    """Key of the unit behind port: its USB location (hub port path, e.g. "1-1.2")
+
+    The location stays the same when the unit re-enumerates in another
+    mode on a new COM port, unlike the port name, and a 9008 EDL port
+    usually reports no USB serial number. Falls back to the serial
+    number, then the port name, when the location is unknown.
+    """
+    location = getattr(port, "location", None)
+    if location:
+        # Drop the interface suffix (":1.0", ":x.0") so all interfaces of a unit share the key
+        return location.split(":")[0]
+    return port.serial_number or port.device
+
+
+def device_mode(port):
+    return MODE_EDL if is_edl_port(port) else MODE_NORMAL
+
+
+class DeviceWatcher:
+    """Watch serial ports for Qualcomm devices and emit attach/detach/mode-change events
+
+    Ports are matched on the structured port.vid/port.pid fields. Changes
+    are picked up through udev hotplug notifications when pyudev is
+    installed, otherwise by polling with an interval that drops to
+    min_interval after a change and backs off to max_interval when idle.
+    port_provider replaces serial.tools.list_ports.comports, e.g. in tests.
+    """
+
+    def __init__(self, port_provider=None, vendor_id=QUALCOMM_VENDOR_ID,
+                 min_interval=MIN_POLL_INTERVAL, max_interval=MAX_POLL_INTERVAL, hotplug=True):
+        self.port_provider = port_provider or serial.tools.list_ports.comports
+        self.vendor_id = vendor_id
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.devices = {}
+        self._callbacks = []
+        self._changed = threading.Condition()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._observer = self._start_hotplug() if hotplug and port_provider is None else None
+        if self._observer:
+            self.max_interval = max(self.max_interval, HOTPLUG_POLL_INTERVAL)
+
+    def _start_hotplug(self):
+        if pyudev is None:
+            return None
+        try:
+            context = pyudev.Context()
+            monitor = pyudev.Monitor.from_netlink(context)
+            monitor.filter_by(subsystem="tty")
+            observer = pyudev.MonitorObserver(monitor, callback=lambda device: self._wake.set())
+            observer.daemon = True
+            observer.start()
+            return observer
+        except Exception as e:
+            print(f"[WARN] Hotplug notifications unavailable, polling instead: {e}")
+            return None
+
+    def subscribe(self, callback):
+        """Call callback(event) for every DeviceEvent"""
+        self._callbacks.append(callback)
+
+    def enumerate(self):
+        """Return {key: Device} for the Qualcomm ports currently present"""
+        devices = {}
+        try:
+            ports = self.port_provider()
+        except Exception as e:
+            print(f"Error detecting device: {e}")
+            return self.devices
+        for port in ports:
+            if port.vid != self.vendor_id:
+                continue
+            key = unit_key(port)
+            devices[key] = Device(key, port.device, device_mode(port), port.vid, port.pid,
+                                  port.serial_number, getattr(port, "location", None))
+        return devices
+
+    def poll(self):
+        """Enumerate once, update the device table and return the resulting events"""
+        current = self.enumerate()
+        events = []
+        with self._changed:
+            previous = self.devices
+            for key, device in current.items():
+                old = previous.get(key)
+                if old is None:
+                    events.append(DeviceEvent(ATTACH, device, None))
+                elif old.mode != device.mode or old.port != device.port:
+                    events.append(DeviceEvent(MODE_CHANGE, device, old))
+            for key, old in previous.items():
+                if key not in current:
+                    events.append(DeviceEvent(DETACH, old, old))
+            self.devices = current
+            if events:
+                self._changed.notify_all()
+        for event in events:
+            for callback in self._callbacks:
+                callback(event)
+        return events
+
+    def find(self, mode=None, key=None):
+        """Return the first known device in mode (any mode if None), or None
+
+        With key, only the device with that key is considered.
+        """
+        for device in self.devices.values():
+            if (mode is None or device.mode == mode) and (key is None or device.key == key):
+                return device
+        return None
+
+    def _sleep(self, interval):
+        self._wake.wait(interval)
+        self._wake.clear()
+
+    def _run(self):
+        interval = self.min_interval
+        while not self._stop.is_set():
+            events = self.poll()
+            interval = self.min_interval if events else min(interval * 2, self.max_interval)
+            self._sleep(interval)
+
+    def start(self):
+        """Poll in a background thread, dispatching events to subscribers"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+
+    def wait_for(self, mode=None, timeout=None, key=None):
+        """Block until a device in mode (and with key, if given) is present and return it, or None on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        interval = self.min_interval
+        while True:
+            if self._thread is None:
+                events = self.poll()
+                interval = self.min_interval if events else min(interval * 2, self.max_interval)
+            device = self.find(mode, key)
+            if device:
+                return device
+            wait = interval
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                wait = min(wait, remaining)
+            if self._thread is None:
+                self._sleep(wait)
+            else:
+                with self._changed:
+                    self._changed.wait(wait)
@@ -5,37 +5,25 @@ except ImportError:
     print("Please install it using: pip install pyserial")
     exit(1)
 
-def find_qualcomm_device():
-    """
-    Detect if a Qualcomm device is connected via USB.
-    :return: A tuple (port, is_edl_mode), where port is the device port (e.g., COM3) and is_edl_mode is True if the device is in EDL mode.
-    """
-    try:
-        # Qualcomm USB Vendor ID and common Product IDs for EDL mode
-        QUALCOMM_VENDOR_ID = "05C6"  # Qualcomm's USB Vendor ID
-        EDL_PRODUCT_IDS = ["9008"]   # Common Product ID for EDL mode
+# Qualcomm USB Vendor ID and common Product IDs for EDL mode, shared by the hardware modules
+QUALCOMM_VENDOR_ID = 0x05C6  # Qualcomm's USB Vendor ID
+EDL_PRODUCT_IDS = {0x9008}   # Common Product ID for EDL mode
 
-        # List all connected devices
-        ports = serial.tools.list_ports.comports()
-        for port in ports:
-            if QUALCOMM_VENDOR_ID in port.hwid:
-                # Check if the device is in EDL mode
-                for edl_id in EDL_PRODUCT_IDS:
-                    if edl_id in port.hwid:
-                        return port.device, True  # Device is in EDL mode
-                return port.device, False  # Device connected but not in EDL mode
+def is_qualcomm_port(port):
+    """True if a serial port (a serial.tools.list_ports entry) belongs to a Qualcomm device"""
+    return port.vid == QUALCOMM_VENDOR_ID
 
-        return None, False  # No Qualcomm device found
-    except Exception as e:
-        print(f"Error detecting device: {str(e)}")
-        return None, False
+def is_edl_port(port):
+    """True if a Qualcomm serial port is in EDL mode"""
+    return port.pid in EDL_PRODUCT_IDS
 
 if __name__ == "__main__":
-    port, is_edl_mode = find_qualcomm_device()
-    if port:
-        if is_edl_mode:
-            print(f"Qualcomm device detected on {port} in EDL mode.")
+    ports = sorted((port for port in serial.tools.list_ports.comports() if is_qualcomm_port(port)),
+                   key=lambda port: port.device)
+    for port in ports:
+        if is_edl_port(port):
+            print(f"Qualcomm device detected on {port.device} in EDL mode.")
         else:
-            print(f"Qualcomm device detected on {port}, but not in EDL mode.")
-    else:
+            print(f"Qualcomm device detected on {port.device}, but not in EDL mode.")
+    if not ports:
         print("No Qualcomm device detected.")
@@ -0,0 +1,90 @@
+import time
+import random
+import subprocess
+
+try:
+    import serial
+    import serial.tools.list_ports
+except ImportError:
+    print("Error: The 'pyserial' package is not installed.")
+    print("Please install it using: pip install pyserial")
+    exit(1)
+
+PROBE_INTERVAL = 0.1       # First delay between readiness probes
+MAX_PROBE_INTERVAL = 1.0   # Longest delay between readiness probes
+RETRY_BASE_DELAY = 1.0     # First delay between retries of a failed step
+MAX_RETRY_DELAY = 30.0     # Longest delay between retries
+JITTER = 0.2               # Delays vary by up to +-20% so units do not retry in lockstep
+PORT_READY_TIMEOUT = 15    # Seconds for a freshly enumerated port to accept an open
+FASTBOOT_READY_TIMEOUT = 30  # Seconds for the device to show up in "fastboot devices"
+
+
+def jittered(delay, jitter=JITTER, rng=random.random):
+    return max(0.0, delay * (1 + jitter * (2 * rng() - 1)))
+
+
+def retry_delay(attempt, base=RETRY_BASE_DELAY, maximum=MAX_RETRY_DELAY, jitter=JITTER, rng=random.random):
+    """Exponential backoff with jitter: about base, 2*base, 4*base ... up to maximum for attempt 1, 2, 3 ..."""
+    return jittered(min(base * 2 ** max(0, attempt - 1), maximum), jitter, rng)
+
+
+def wait_until(probe, timeout, description="device", interval=PROBE_INTERVAL,
+               max_interval=MAX_PROBE_INTERVAL, sleep=time.sleep, clock=time.monotonic):
+    """Call probe() until it returns a true value and return that value, or None after timeout seconds
+
+    The delay between probes starts at interval and doubles (with
+    jitter) up to max_interval, so a device that is already ready costs
+    one probe and a slow one is not polled in a tight loop. A probe that
+    raises counts as not ready.
+    """
+    start = clock()
+    delay = interval
+    last_error = None
+    while True:
+        try:
+            value = probe()
+        except Exception as e:
+            value, last_error = None, e
+        if value:
+            waited = clock() - start
+            if waited >= 1:
+                print(f"[INFO] {description} ready after {waited:.1f}s")
+            return value
+        remaining = start + timeout - clock()
+        if remaining <= 0:
+            reason = f" (last error: {last_error})" if last_error else ""
+            print(f"[ERROR] {description} not ready within {timeout:g}s{reason}")
+            return None
+        sleep(min(jittered(delay), remaining))
+        delay = min(delay * 2, max_interval)
+
+
+def port_present(port):
+    """The serial port is enumerated"""
+    return any(p.device == port for p in serial.tools.list_ports.comports())
+
+
+def port_openable(port):
+    """The serial port is enumerated and can be opened
+
+    Not for EDL ports: on Windows pyserial purges the receive buffer when
+    it opens a port, which would discard the Sahara hello QSaharaServer
+    waits for. Use port_present there.
+    """
+    if not port_present(port):
+        return False
+    try:
+        serial.Serial(port).close()
+    except (serial.SerialException, OSError):
+        return False
+    return True
+
+
+def fastboot_listed(serial_number=None):
+    """"fastboot devices" lists a device (the one with serial_number, if given)"""
+    output = subprocess.check_output(["fastboot", "devices"], stderr=subprocess.STDOUT, text=True, timeout=10)
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) >= 2 and fields[1] == "fastboot" and (not serial_number or fields[0] == serial_number):
+            return True
+    return False
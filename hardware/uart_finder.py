@@ -0,0 +1,115 @@
+import os
+import re
+import json
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import serial
+    import serial.tools.list_ports
+except ImportError:
+    print("Error: The 'pyserial' package is not installed.")
+    print("Please install it using: pip install pyserial")
+    exit(1)
+
+from hardware.qualcomm_detector import is_qualcomm_port
+
+# USB-to-UART bridges used as debug UART on the station boards
+DEBUG_UART_IDS = {
+    (0x0403, 0x6001), (0x0403, 0x6010), (0x0403, 0x6011), (0x0403, 0x6014), (0x0403, 0x6015),  # FTDI
+    (0x10C4, 0xEA60), (0x10C4, 0xEA70),  # Silicon Labs CP210x
+    (0x067B, 0x2303),                    # Prolific PL2303
+    (0x1A86, 0x7523), (0x1A86, 0x55D4),  # WCH CH340 / CH9102
+}
+DEBUG_UART_KEYWORDS = ("uart", "usb serial", "ftdi", "cp210", "prolific", "ch340", "ch910")
+
+DEFAULT_CACHE_FILE = os.path.join("utils", "cache", "debug_uart.json")
+PROBE_TIMEOUT = 0.2
+
+
+def _port_sort_key(name):
+    """Natural sort so COM2 comes before COM10"""
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
+def is_debug_uart(port):
+    if (port.vid, port.pid) in DEBUG_UART_IDS:
+        return True
+    description = (port.description or "").lower()
+    return any(keyword in description for keyword in DEBUG_UART_KEYWORDS)
+
+
+def probe_port(port_name, baud_rate, timeout=PROBE_TIMEOUT):
+    """True if the port can be opened"""
+    try:
+        with serial.Serial(port_name, baud_rate, timeout=timeout):
+            return True
+    except (serial.SerialException, OSError, ValueError):
+        return False
+
+
+class DebugUartFinder:
+    """Find the debug UART from the enumerated serial ports instead of probing COM1-COM255
+
+    Candidates are ports with a known USB-UART bridge VID/PID or
+    description; if none match, every non-Qualcomm port is considered.
+    The last good port of this station is tried first. The remaining
+    candidates are probed concurrently, and the best ranked port that
+    opens is returned.
+    """
+
+    def __init__(self, baud_rate, port_provider=None, cache_file=DEFAULT_CACHE_FILE,
+                 station=None, probe=probe_port):
+        self.baud_rate = baud_rate
+        self.port_provider = port_provider or serial.tools.list_ports.comports
+        self.cache_file = cache_file
+        self.station = station or socket.gethostname()
+        self.probe = probe
+
+    def candidates(self):
+        ports = [p for p in self.port_provider() if not is_qualcomm_port(p)]
+        preferred = [p for p in ports if is_debug_uart(p)]
+        chosen = preferred or ports
+        return sorted((p.device for p in chosen), key=_port_sort_key)
+
+    def find(self):
+        candidates = self.candidates()
+        if not candidates:
+            return None
+
+        cached = self._load_cached()
+        if cached in candidates and self.probe(cached, self.baud_rate):
+            return cached
+
+        with ThreadPoolExecutor(max_workers=len(candidates)) as pool:
+            results = list(pool.map(lambda name: self.probe(name, self.baud_rate), candidates))
+        for name, ok in zip(candidates, results):
+            if ok:
+                self._save_cached(name)
+                return name
+        return None
+
+    def _load_cached(self):
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                return json.load(f).get(self.station)
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def _save_cached(self, port_name):
+        try:
+            try:
+                with open(self.cache_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            data[self.station] = port_name
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_file)), exist_ok=True)
+            with open(self.cache_file, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+        except OSError as e:
+            print(f"[WARN] Could not save debug UART cache: {e}")
+
+
+def find_debug_uart(baud_rate, port_provider=None):
+    return DebugUartFinder(baud_rate, port_provider).find()
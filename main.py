@@ -1,11 +1,12 @@
 import os
 import sys
 import time
-import subprocess
 import configparser
-from hardware.qualcomm_detector import find_qualcomm_device
-from software.qfil_controller import run_qfil_controller
-from software.fastboot_flash import run_fastboot_flash
+from hardware.device_watcher import DeviceWatcher, MODE_EDL, MODE_NORMAL
+from hardware.readiness import retry_delay
+from extract.image_manifest import get_manifest
+from pipeline import stages
+from software.process_runner import run_process, ScriptResultParser, final_result
 
 CONFIG_PATH = os.path.join(os.path.dirname(__file__), "config.ini")
 
@@ -21,36 +22,21 @@ def run_script(path):
         return False
 
     env = dict(os.environ, PYTHONUNBUFFERED="1")
-    proc = subprocess.Popen([sys.executable, '-u', path, '--called'],
-                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                            text=True, bufsize=1, env=env)
-
-    success = False
     try:
-        for line in proc.stdout:
-            print(line.strip())
-            if "[RESULT] SUCCESS" in line:
-                success = True
-            elif "[RESULT] FAIL" in line:
-                success = False
+        result = run_process([sys.executable, '-u', path, '--called'], env=env,
+                             parsers=[ScriptResultParser()], on_line=lambda line: print(line.strip()))
     except Exception as e:
         print(f"[ERROR] Reading output failed: {e}")
-    
-    return success or proc.wait() == 0
-
-def run_mcu_script(script_path, images_path):
-    """Run MCU script with images_path parameter and return success status"""
-    if not os.path.isfile(script_path):
-        print(f"[ERROR] Script not found: {script_path}")
         return False
 
+    return bool(final_result(result.events)) or result.returncode == 0
+
+def run_mcu_stage(component_name, images_path):
+    """Program one MCU in-process and return success status"""
     try:
-        # Call the script with images_path as argument
-        result = subprocess.run([sys.executable, script_path, images_path], 
-                              capture_output=False, text=True)
-        return result.returncode == 0
+        return stages.flash_mcu(component_name, images_path, config_path=CONFIG_PATH)
     except Exception as e:
-        print(f"[ERROR] Error running script {script_path}: {e}")
+        print(f"[ERROR] Error flashing MCU {component_name}: {e}")
         return False
 
 
@@ -62,46 +48,15 @@ def download_and_extract():
     try:
         
         print("=== Starting download phase ===")
-        # Call setup script to configure JFrog CLI
-        download_script_path = os.path.join(os.path.dirname(__file__), 'download', 'setup_jfrog.py')
-        if not os.path.exists(download_script_path):
-            print(f"Download script not found: {download_script_path}")
-            return None
-        # Run download script
-        result = subprocess.run([sys.executable, download_script_path], 
-                              capture_output=False, text=True)
-        if result.returncode != 0:
-            print("Error occurred during download process")
-            return None
-
-        
-        # Call download script
-        download_script_path = os.path.join(os.path.dirname(__file__), 'download', 'download_by_version.py')
-        if not os.path.exists(download_script_path):
-            print(f"Download script not found: {download_script_path}")
-            return None
-        # Run download script
-        result = subprocess.run([sys.executable, download_script_path], 
-                              capture_output=False, text=True)
-        if result.returncode != 0:
+        # Stages run in this process; their modules are imported on first use
+        if not stages.download(config_path=CONFIG_PATH):
             print("Error occurred during download process")
             return None
             
         print("Download completed")
         
-        # Call extraction script
         print("\n=== Starting extraction phase ===")
-        unzipper_script_path = os.path.join(os.path.dirname(__file__), 'extract', 'unzipper.py')
-        
-        if not os.path.exists(unzipper_script_path):
-            print(f"Extraction script not found: {unzipper_script_path}")
-            return None
-            
-        # Run extraction script
-        result = subprocess.run([sys.executable, unzipper_script_path], 
-                              capture_output=False, text=True)
-        
-        if result.returncode != 0:
+        if not stages.extract(config_path=CONFIG_PATH):
             print("Error occurred during extraction process")
             return None
             
@@ -119,7 +74,7 @@ def download_and_extract():
         return None
 
 
-def flash_mcu_component(component_name, script_path, images_path):
+def flash_mcu_component(component_name, images_path):
     """Flash a specific MCU component with auto-retry on failure"""
     print(f"\n=== {component_name.upper()} Flashing ===")
     
@@ -130,18 +85,42 @@ def flash_mcu_component(component_name, script_path, images_path):
         print(f"Connect and power on Renesas {component_name.upper()} board.")
         input(f"Press Enter when {component_name.upper()} board is ready...")
     
+    attempt = 0
     while True:
-        success = run_mcu_script(script_path, images_path)
+        attempt += 1
+        success = run_mcu_stage(component_name, images_path)
         
         if success:
             print(f"[SUCCESS] MCU {component_name.upper()} flashing completed successfully!")
             break
         else:
-            print(f"[ERROR] MCU {component_name.upper()} flashing failed, retrying in 5 seconds...")
-            time.sleep(5)
+            delay = retry_delay(attempt)
+            print(f"[ERROR] MCU {component_name.upper()} flashing failed, retrying in {delay:.1f} seconds...")
+            time.sleep(delay)
             
 
 
+def flash_mcu_components_concurrently(images_path):
+    """Flash METER and IVI at the same time on their own tools, retrying the boards that fail"""
+    print("\n=== METER + IVI Flashing ===")
+    print("Connect and power on both Renesas boards, each on its own E2 tool.")
+    input("Press Enter when both boards are ready...")
+
+    pending = ["METER", "IVI"]
+    attempt = 0
+    while pending:
+        attempt += 1
+        results = stages.flash_mcu_concurrent(images_path, pending, config_path=CONFIG_PATH)
+        for component in pending:
+            if results[component]:
+                print(f"[SUCCESS] MCU {component} flashing completed successfully!")
+        pending = [component for component in pending if not results[component]]
+        if pending:
+            delay = retry_delay(attempt)
+            print(f"[ERROR] MCU {', '.join(pending)} flashing failed, retrying in {delay:.1f} seconds...")
+            time.sleep(delay)
+
+
 def show_firmware_selection():
     print("\n=== Firmware Selection ===")
     while True:
@@ -162,10 +141,7 @@ def show_firmware_selection():
             print("Invalid input. Enter 1, 2, or 'exit'.")
 
 def find_folder(root_path, target_folder_name):
-    for dirpath, dirnames, _ in os.walk(root_path):
-        if target_folder_name in dirnames:
-            return os.path.join(dirpath, target_folder_name)
-    return None
+    return get_manifest(root_path).find_dir(target_folder_name)
 
 def main():
     print("=== Firmware Flashing Tool ===")
@@ -194,30 +170,33 @@ def main():
 
 
 
+    # Waits for the EDL / NORMAL device without busy-polling the serial ports
+    watcher = DeviceWatcher()
+
     # QFIL
     if not skip_qfil:
         print("\n" + "="*50)
         print("Starting QFIL Flashing Phase")
         print("="*50)
         print("Please connect device in EDL mode (DLOAD) to continue...")
+        attempt = 0
         while True:
-            port, is_edl_mode = find_qualcomm_device()
-            if port and is_edl_mode:
+            port = watcher.wait_for(MODE_EDL).port
+            if port:
                 print(f"Device detected (Port: {port}, Mode: DLOAD)")
+                attempt += 1
                 try:
                     print("Starting QFIL flashing...")
-                    print("Waiting for device to stabilize...")
-                    time.sleep(5)
                     print("Running QFIL controller script...")
-                    if not run_qfil_controller(abs_images_path):
-                        print("[ERROR] QFIL flashing failed, please check connection and try again.")
-                        print("Please connect device in EDL mode to continue...")
-                        continue
-                    print("QFIL flashing completed successfully")
-                    break
+                    if stages.flash_qfil(abs_images_path, port=port):
+                        print("QFIL flashing completed successfully")
+                        break
+                    print("[ERROR] QFIL flashing failed, please check connection and try again.")
+                    print("Please connect device in EDL mode to continue...")
                 except Exception as e:
                     print(f"[ERROR] Error during execution: {e}")
-                    continue
+                # The device is usually still attached, so back off instead of retrying at once
+                time.sleep(retry_delay(attempt))
     else:
         print("\n[INFO] Skipping QFIL flashing phase because 'sail_nor' folder is empty.")
 
@@ -228,46 +207,58 @@ def main():
     print("Starting Fastboot Flashing Phase")
     print("="*50)
     print("Please connect device in NORMAL mode to continue...")
+    attempt = 0
     while True:
-        port, is_edl_mode = find_qualcomm_device()
-        if port and not is_edl_mode:
+        port = watcher.wait_for(MODE_NORMAL).port
+        if port:
             print(f"Device detected (Port: {port}, Mode: NORMAL)")
             print("Please disconnect device from EDL mode and connect in Fastboot mode.")
+            attempt += 1
             try:
                 print("Running fastboot flash script...")
-                print("Waiting for device to stabilize...")
-                time.sleep(5) 
                 print("Starting fastboot flash...")
-                if not run_fastboot_flash(abs_images_path):
-                    print("[ERROR] Fastboot flash failed, please check connection and try again.")
-                    print("Please connect device in NORMAL mode to continue...")
-                    continue
-                print("Fastboot flashing completed successfully")
-                break
+                if stages.flash_fastboot(abs_images_path):
+                    print("Fastboot flashing completed successfully")
+                    break
+                print("[ERROR] Fastboot flash failed, please check connection and try again.")
+                print("Please connect device in NORMAL mode to continue...")
             except Exception as e:
                 print(f"[ERROR] Fastboot and run fastboot script failed: {e}")
-                continue
+            time.sleep(retry_delay(attempt))
 
 
     # MCU Components Flashing
     print("\n" + "="*50)
     print("Starting MCU Components Flashing Phase")
     print("="*50)
-    
-    # MCU METER - with automatic connection checking and retry
-    flash_mcu_component("METER", get_absolute_path('software/MCU_METER_controller.py'), abs_images_path)
-    
-    # Pause between METER and IVI
-    print("\n" + "-"*50)
-    print("METER flashing completed. Now preparing for IVI flashing...")
-    print("Please disconnect METER board and connect IVI board...")
 
-    # MCU IVI - with user confirmation and retry
-    flash_mcu_component("IVI", get_absolute_path('software/MCU_IVI_controller.py'), abs_images_path)
+    mcu_settings = stages.mcu_settings(CONFIG_PATH)
+    mcu_error = mcu_settings.concurrency_error() if mcu_settings.concurrent else None
+    if mcu_error:
+        print(f"[WARN] Programming the MCUs one after the other: {mcu_error}")
+
+    if mcu_settings.concurrent and not mcu_error:
+        # Both boards attached on their own tools
+        flash_mcu_components_concurrently(abs_images_path)
+    else:
+        # MCU METER - with automatic connection checking and retry
+        flash_mcu_component("METER", abs_images_path)
+
+        # Pause between METER and IVI
+        print("\n" + "-"*50)
+        print("METER flashing completed. Now preparing for IVI flashing...")
+        print("Please disconnect METER board and connect IVI board...")
+
+        # MCU IVI - with user confirmation and retry
+        flash_mcu_component("IVI", abs_images_path)
     
     print("\n" + "="*50)
     print("All flashing operations completed!")
     print("="*50)
 
 if __name__ == "__main__":
+    if "--batch" in sys.argv:
+        # Headless mode: no prompts, options from --job and/or the command line
+        from pipeline.batch import main as batch_main
+        sys.exit(batch_main(sys.argv[1:]))
     main()
@@ -0,0 +1,399 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import namedtuple
+
+# Allow "python pipeline/batch.py" to import sibling packages
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from pipeline import stages
+
+STAGE_NAMES = ["download", "extract", "qfil", "fastboot", "mcu_meter", "mcu_ivi"]
+FLASH_STAGES = ["qfil", "fastboot", "mcu_meter", "mcu_ivi"]
+
+DEFAULT_RETRIES = 3          # Attempts per stage
+DEFAULT_RETRY_DELAY = 5      # Seconds between attempts
+DEFAULT_DEVICE_TIMEOUT = 600  # Seconds to wait for the EDL / NORMAL device per attempt
+DEFAULT_RESULTS_DIR = os.path.join("utils", "logs", "batch")
+DEFAULT_CONCURRENCY = 4       # Units flashed at the same time in parallel mode
+
+# What a stage function knows about its unit: the watcher key (None in a
+# single-unit run), the port the unit was detected on (None before it is
+# seen) and its job config
+DeviceContext = namedtuple("DeviceContext", "key port config")
+
+
+class BatchJob:
+    """What a headless run does: the firmware source, the stages and the retry policy
+
+    Exactly one of version (download and extract first) or images_path
+    (flash existing images) is required. stages defaults to every stage
+    that applies to the source. devices maps a unit key (USB serial or
+    port) to its settings, e.g. {"uart": "COM7", "fastboot_serial": "..."},
+    and is used by the parallel orchestrator. stage_retries overrides
+    retries per job stage or graph node, and prefetch names a version to
+    download into the artifact cache while this one flashes.
+    """
+
+    def __init__(self, version=None, images_path=None, stages=None, retries=DEFAULT_RETRIES,
+                 retry_delay=DEFAULT_RETRY_DELAY, device_timeout=DEFAULT_DEVICE_TIMEOUT,
+                 results=None, config_path=stages.CONFIG_PATH, name=None, devices=None,
+                 concurrency=DEFAULT_CONCURRENCY, stage_retries=None, prefetch=None):
+        if bool(version) == bool(images_path):
+            raise ValueError("A job needs exactly one of 'version' or 'images_path'")
+        self.version = version
+        self.images_path = images_path
+        self.stages = list(stages or (STAGE_NAMES if version else FLASH_STAGES))
+        unknown = [s for s in self.stages if s not in STAGE_NAMES]
+        if unknown:
+            raise ValueError(f"Unknown stages: {', '.join(unknown)} (valid: {', '.join(STAGE_NAMES)})")
+        if images_path and {"download", "extract"} & set(self.stages):
+            raise ValueError("'download' and 'extract' need a version, not an images_path")
+        self.retries = max(1, int(retries))
+        self.retry_delay = float(retry_delay)
+        self.device_timeout = float(device_timeout)
+        self.results = results
+        self.config_path = config_path
+        self.name = name or version or os.path.basename(os.path.abspath(images_path))
+        self.devices = dict(devices or {})
+        self.concurrency = max(1, int(concurrency))
+        self.stage_retries = {name: max(1, int(n)) for name, n in (stage_retries or {}).items()}
+        self.prefetch = prefetch
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "version": self.version,
+            "images_path": self.images_path,
+            "stages": self.stages,
+            "retries": self.retries,
+            "retry_delay": self.retry_delay,
+            "device_timeout": self.device_timeout,
+            "devices": self.devices,
+            "concurrency": self.concurrency,
+            "stage_retries": self.stage_retries,
+            "prefetch": self.prefetch,
+        }
+
+
+def _not_release(name):
+    return not stages.is_release_part(name)
+
+
+def default_stage_functions():
+    """Functions for the graph nodes, each fn(job, images_path, device, cancel_event) -> bool
+
+    cancel_event is set on Ctrl+C; the stages pass it down so running
+    tools are killed and downloads and extraction stop.
+    """
+    return {
+        # Split RELEASE parts and MCU tarballs download side by side, so the
+        # MCU images can be extracted while the RELEASE parts still download
+        "download_release": lambda job, images_path, device, cancel_event: stages.download(
+            job.version, job.config_path, select=stages.is_release_part, stream_extract=False,
+            cancel_event=cancel_event),
+        "download_mcu": lambda job, images_path, device, cancel_event: stages.download(
+            job.version, job.config_path, select=_not_release, stream_extract=False,
+            cancel_event=cancel_event),
+        "clear_extracted": lambda job, images_path, device, cancel_event: stages.clear_extracted(),
+        "extract_release": lambda job, images_path, device, cancel_event: stages.extract(
+            job.config_path, select=stages.is_release_part, clear=False, cancel_event=cancel_event),
+        "extract_mcu": lambda job, images_path, device, cancel_event: stages.extract(
+            job.config_path, select=_not_release, clear=False, cancel_event=cancel_event),
+        "prefetch": lambda job, images_path, device, cancel_event: stages.prefetch(
+            job.prefetch, job.config_path, cancel_event=cancel_event),
+        # One QFIL attempt per call; the runner owns the retry policy
+        # Tool logs are per unit (device.key) when several units flash at once
+        "qfil": lambda job, images_path, device, cancel_event: stages.flash_qfil(
+            images_path, max_attempts=1, port=device.port, unit=device.key, cancel_event=cancel_event),
+        "fastboot": lambda job, images_path, device, cancel_event: stages.flash_fastboot(
+            images_path, uart_port=device.config.get("uart"),
+            serial_number=device.config.get("fastboot_serial"), unit=device.key, cancel_event=cancel_event),
+        "mcu_meter": lambda job, images_path, device, cancel_event: stages.flash_mcu(
+            "METER", images_path, serial=device.config.get("meter_serial"), config_path=job.config_path,
+            unit=device.key, cancel_event=cancel_event),
+        "mcu_ivi": lambda job, images_path, device, cancel_event: stages.flash_mcu(
+            "IVI", images_path, serial=device.config.get("ivi_serial"), config_path=job.config_path,
+            unit=device.key, cancel_event=cancel_event),
+    }
+
+
+class BatchRunner:
+    """Run a BatchJob without prompts and collect a machine-readable result
+
+    The job stages are expanded into a dependency graph run by
+    pipeline.dag.DagScheduler, so independent work overlaps: the MCU
+    tarballs download and extract while the RELEASE parts are still
+    downloading, the EDL device is awaited during download and extract,
+    and the next version (job.prefetch) downloads while the unit flashes.
+
+    stage_functions maps graph node names to fn(job, images_path, device, cancel_event) -> bool,
+    where device is a DeviceContext, and watcher is a DeviceWatcher; both
+    can be replaced with stand-ins, e.g. to run the whole pipeline in tests
+    without hardware. With device_key the runner only waits for that unit,
+    and stages restricts the run to part of job.stages. cancel_event can
+    be shared, so one cancel() stops several runners.
+    """
+
+    def __init__(self, job, stage_functions=None, watcher=None, sleep=None,
+                 device_key=None, stages=None, cancel_event=None):
+        self.job = job
+        self.stage_functions = dict(default_stage_functions(), **(stage_functions or {}))
+        self.watcher = watcher
+        self.sleep = sleep
+        self.device_key = device_key
+        self.stages = list(stages if stages is not None else job.stages)
+        self.cancel_event = cancel_event or threading.Event()
+        self.scheduler = None
+        self._images_settled = threading.Event()
+
+    def images_path(self):
+        if self.job.images_path:
+            return os.path.abspath(self.job.images_path)
+        return os.path.abspath(stages.EXTRACT_DIR)
+
+    def _get_watcher(self):
+        if self.watcher is None:
+            from hardware.device_watcher import DeviceWatcher
+            self.watcher = DeviceWatcher()
+        return self.watcher
+
+    def _device_config(self):
+        return self.job.devices.get(self.device_key, {})
+
+    def _wait_for_device(self, mode, cancel_event):
+        """Return the DeviceContext of the unit once it is in mode, or None on timeout/cancel"""
+        print(f"[INFO] Waiting up to {self.job.device_timeout:.0f}s for a device in {mode} mode...")
+        deadline = time.monotonic() + self.job.device_timeout
+        while not cancel_event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            device = self._get_watcher().wait_for(mode, timeout=min(remaining, 1.0), key=self.device_key)
+            if device is not None:
+                print(f"[INFO] Device detected (Port: {device.port}, Mode: {mode})")
+                return DeviceContext(self.device_key, device.port, self._device_config())
+        return None
+
+    def _watch_for_edl(self, cancel_event):
+        """Report the EDL unit as soon as it attaches, for as long as the images are not ready"""
+        from hardware.device_watcher import MODE_EDL
+        from pipeline.dag import StageSkipped
+        print("[INFO] Connect the device in EDL mode now; the images are still being prepared.")
+        while not (cancel_event.is_set() or self._images_settled.is_set()):
+            device = self._get_watcher().wait_for(MODE_EDL, timeout=1.0, key=self.device_key)
+            if device is not None:
+                print(f"[INFO] Device detected (Port: {device.port}, Mode: {MODE_EDL})")
+                return True
+        raise StageSkipped("images were ready before the device attached")
+
+    def _on_result(self, name, result):
+        if name == "extract_release":
+            self._images_settled.set()
+
+    def _mcu_concurrent(self):
+        """Whether METER and IVI can be programmed side by side, each on its own tool"""
+        settings = stages.mcu_settings(self.job.config_path)
+        if not settings.concurrent:
+            return False
+        config = self._device_config()
+        error = settings.concurrency_error({"METER": config.get("meter_serial"),
+                                            "IVI": config.get("ivi_serial")})
+        if error:
+            print(f"[WARN] Programming the MCUs one after the other: {error}")
+            return False
+        return True
+
+    def graph(self):
+        """Return [(node, job stage, dependencies)] for the stages of this run"""
+        wanted = set(self.stages)
+        download = "download" in wanted
+        extract = "extract" in wanted
+        nodes = []
+        if download:
+            nodes += [("download_mcu", "download", []), ("download_release", "download", [])]
+        if extract:
+            # Old images are only removed once the first new files are in
+            first = ["download_mcu"] if download else []
+            nodes += [
+                ("clear_extracted", "extract", first),
+                ("extract_mcu", "extract", first + ["clear_extracted"]),
+                ("extract_release", "extract", (["download_release"] if download else []) + ["clear_extracted"]),
+            ]
+        if download and self.job.prefetch:
+            nodes.append(("prefetch", "download", ["download_mcu", "download_release"]))
+
+        mcu_concurrent = "mcu_meter" in wanted and "mcu_ivi" in wanted and self._mcu_concurrent()
+        previous = None
+        for stage in FLASH_STAGES:
+            if stage not in wanted:
+                continue
+            if stage == "mcu_ivi" and mcu_concurrent:
+                # Both boards are attached on their own tools, start IVI together with METER
+                nodes.append((stage, stage, list(nodes[-1][2])))
+                continue
+            deps = [previous] if previous else []
+            if extract:
+                deps.append("extract_mcu" if stage.startswith("mcu_") else "extract_release")
+            elif download:
+                # No extraction in this run, but never flash while the download is still going
+                deps.append("download_mcu" if stage.startswith("mcu_") else "download_release")
+            if stage == "qfil" and extract:
+                # Look for the unit while the images are still being prepared
+                nodes.append(("edl_device", "qfil", []))
+                deps.append("edl_device")
+            nodes.append((stage, stage, deps))
+            previous = stage
+        return nodes
+
+    def _node_function(self, node, images_path):
+        from hardware.device_watcher import MODE_EDL, MODE_NORMAL
+        from pipeline.dag import StageSkipped
+
+        def run(cancel_event):
+            if node == "edl_device":
+                return self._watch_for_edl(cancel_event)
+            device = DeviceContext(self.device_key, None, self._device_config())
+            if node in FLASH_STAGES:
+                if not os.path.isdir(images_path):
+                    raise FileNotFoundError(f"Images path not found: {images_path}")
+                if node == "qfil":
+                    from extract.image_manifest import get_manifest
+                    sail_nor = get_manifest(images_path).find_dir("sail_nor")
+                    if sail_nor and not os.listdir(sail_nor):
+                        raise StageSkipped("'sail_nor' folder is empty (KOH image)")
+                mode = {"qfil": MODE_EDL, "fastboot": MODE_NORMAL}.get(node)
+                if mode:
+                    device = self._wait_for_device(mode, cancel_event)
+                    if device is None:
+                        raise TimeoutError(f"No device in {mode} mode within {self.job.device_timeout:.0f}s")
+            return self.stage_functions[node](self.job, images_path, device, cancel_event)
+        return run
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        from pipeline.dag import DagScheduler, Stage
+        started_at = time.strftime("%Y-%m-%d %H:%M:%S")
+        start = time.monotonic()
+        images_path = self.images_path()
+        graph_stages = []
+        for node, job_stage, deps in self.graph():
+            retries = 1 if node == "edl_device" else self.job.stage_retries.get(
+                node, self.job.stage_retries.get(job_stage, self.job.retries))
+            graph_stages.append(Stage(node, self._node_function(node, images_path), deps,
+                                      retries=retries, retry_delay=self.job.retry_delay,
+                                      optional=node in ("prefetch", "edl_device")))
+        self._images_settled.clear()
+        # Under pipeline.device_output the stage threads write to this unit's log
+        output = sys.stdout
+        initializer = None
+        if hasattr(output, "attach"):
+            stream = output.bound()
+            initializer = lambda: output.attach(stream)
+        self.scheduler = DagScheduler(graph_stages, max_workers=max(1, len(graph_stages)),
+                                      sleep=self.sleep, on_result=self._on_result,
+                                      initializer=initializer, cancel_event=self.cancel_event)
+        node_results = self.scheduler.run()
+        return {
+            "job": self.job.to_dict(),
+            "images_path": images_path,
+            "ok": self.scheduler.ok(node_results),
+            "started_at": started_at,
+            "duration": round(time.monotonic() - start, 3),
+            "stages": list(node_results.values()),
+        }
+
+
+def write_results(results, path=None):
+    """Write the results JSON and return its path"""
+    if path is None:
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        name = "".join(c if c.isalnum() or c in "._-" else "_" for c in results["job"]["name"])
+        path = os.path.join(DEFAULT_RESULTS_DIR, f"{stamp}_{name}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Run the flashing pipeline without prompts.")
+    parser.add_argument("--batch", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--job", help="JSON job file; command line options override its values")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--version", help="Download and extract this version first")
+    source.add_argument("--images-path", help="Flash the images already in this directory")
+    parser.add_argument("--stages", help=f"Comma separated stages to run ({','.join(STAGE_NAMES)})")
+    parser.add_argument("--retries", type=int, help=f"Attempts per stage (default {DEFAULT_RETRIES})")
+    parser.add_argument("--retry-delay", type=float, help=f"Seconds between attempts (default {DEFAULT_RETRY_DELAY})")
+    parser.add_argument("--device-timeout", type=float,
+                        help=f"Seconds to wait for the device per attempt (default {DEFAULT_DEVICE_TIMEOUT})")
+    parser.add_argument("--results", help=f"Results JSON path (default {DEFAULT_RESULTS_DIR}/<time>_<job>.json)")
+    parser.add_argument("--prefetch", help="Version to download into the cache while this one flashes")
+    parser.add_argument("--parallel", action="store_true", help="Flash every attached unit at the same time")
+    parser.add_argument("--concurrency", type=int,
+                        help=f"Units flashed at the same time with --parallel (default {DEFAULT_CONCURRENCY})")
+    return parser.parse_args(argv)
+
+
+def job_from_args(args):
+    data = {}
+    if args.job:
+        with open(args.job, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    if args.version or args.images_path:
+        data.pop("version", None)
+        data.pop("images_path", None)
+    overrides = {
+        "version": args.version,
+        "images_path": args.images_path,
+        "stages": args.stages.split(",") if args.stages else None,
+        "retries": args.retries,
+        "retry_delay": args.retry_delay,
+        "device_timeout": args.device_timeout,
+        "results": args.results,
+        "concurrency": args.concurrency,
+        "prefetch": args.prefetch,
+    }
+    data.update({k: v for k, v in overrides.items() if v is not None})
+    return BatchJob(**data)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    try:
+        job = job_from_args(args)
+    except (OSError, ValueError, TypeError) as e:
+        print(f"[ERROR] Invalid batch job: {e}")
+        return 2
+
+    print(f"=== Batch job {job.name}: {', '.join(job.stages)} ===")
+    if args.parallel or job.devices:
+        from pipeline.orchestrator import Orchestrator
+        results = Orchestrator(job).run()
+        path = write_results(results, job.results)
+        for stage in results["shared"]:
+            print(f"[INFO] {stage['stage']}: {stage['status']} ({stage['attempts']} attempts, {stage['duration']}s)")
+        for key, device in results["devices"].items():
+            summary = ", ".join(f"{s['stage']} {s['status']}" for s in device["stages"])
+            print(f"[INFO] {key}: {'OK' if device['ok'] else 'FAILED'} ({summary}) log: {device['log']}")
+    else:
+        results = BatchRunner(job).run()
+        path = write_results(results, job.results)
+        for stage in results["stages"]:
+            print(f"[INFO] {stage['stage']}: {stage['status']} ({stage['attempts']} attempts, {stage['duration']}s)")
+    print(f"[INFO] Results written to {path}")
+    print(f"[RESULT] {'SUCCESS' if results['ok'] else 'FAIL'}")
+    return 0 if results["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from hardware.readiness import retry_delay, MAX_RETRY_DELAY
+
+STATUS_OK = "ok"
+STATUS_SKIPPED = "skipped"
+STATUS_FAILED = "failed"
+STATUS_NOT_RUN = "not_run"
+STATUS_CANCELLED = "cancelled"
+WAIT_INTERVAL = 1.0  # Longest blocking wait; Ctrl+C does not interrupt lock waits on Windows
+
+
+class StageSkipped(Exception):
+    """Raised by a stage function when the stage does not apply, e.g. QFIL for a KOH image"""
+
+
+class Stage:
+    """A node in the stage graph
+
+    func(cancel_event) returns True on success; it may raise StageSkipped
+    or any exception (counted as a failed attempt). Each stage gets its own
+    retry policy: up to retries attempts, the first retry_delay seconds
+    apart and then backing off exponentially with jitter.
+    Stages with optional=True do not fail the run, and their dependents
+    still run if they fail.
+    """
+
+    def __init__(self, name, func, deps=(), retries=1, retry_delay=0, optional=False):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.retries = max(1, int(retries))
+        self.retry_delay = retry_delay
+        self.optional = optional
+
+
+class DagScheduler:
+    """Run stages as soon as their dependencies succeed, up to max_workers at a time
+
+    A failed (non-optional) stage marks everything that depends on it as
+    not run, while independent branches carry on. cancel() stops new
+    stages and retries from starting; running stage functions see the
+    cancel event (cancel_event, if given) and are expected to return early.
+    on_result(name, result) is called from the scheduling thread whenever
+    a stage gets its result; initializer() runs first in every worker thread.
+    """
+
+    def __init__(self, stages, max_workers=4, sleep=None, on_result=None, initializer=None,
+                 cancel_event=None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.max_workers = max_workers
+        self.on_result = on_result
+        self.initializer = initializer
+        self.cancel_event = cancel_event or threading.Event()
+        self._sleep = sleep or self.cancel_event.wait
+        for stage in stages:
+            missing = [dep for dep in stage.deps if dep not in self.stages]
+            if missing:
+                raise ValueError(f"Stage {stage.name} depends on unknown stages: {', '.join(missing)}")
+        self._check_acyclic()
+
+    def _check_acyclic(self):
+        state = {}
+
+        def visit(name, path):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Stage dependency cycle: {' -> '.join(path + [name])}")
+            state[name] = "visiting"
+            for dep in self.stages[name].deps:
+                visit(dep, path + [name])
+            state[name] = "done"
+
+        for name in self.stages:
+            visit(name, [])
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def _run_stage(self, stage):
+        result = {"stage": stage.name, "status": STATUS_FAILED, "attempts": 0, "duration": 0.0, "error": None}
+        start = time.monotonic()
+        for attempt in range(1, stage.retries + 1):
+            if self.cancel_event.is_set():
+                result["status"] = STATUS_CANCELLED
+                break
+            result["attempts"] = attempt
+            try:
+                if stage.func(self.cancel_event):
+                    result.update(status=STATUS_OK, error=None)
+                    break
+                result["error"] = f"{stage.name} reported failure"
+            except StageSkipped as e:
+                result.update(status=STATUS_SKIPPED, error=str(e) or None)
+                break
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+            print(f"[ERROR] Stage {stage.name}, attempt {attempt}/{stage.retries}: {result['error']}")
+            if attempt < stage.retries:
+                self._sleep(retry_delay(attempt, stage.retry_delay, max(stage.retry_delay, MAX_RETRY_DELAY)))
+        if result["status"] == STATUS_FAILED and self.cancel_event.is_set():
+            result["status"] = STATUS_CANCELLED
+        result["duration"] = round(time.monotonic() - start, 3)
+        return result
+
+    def _satisfied(self, stage, results):
+        for dep in stage.deps:
+            status = results[dep]["status"]
+            if status in (STATUS_OK, STATUS_SKIPPED) or self.stages[dep].optional:
+                continue
+            return False
+        return True
+
+    def run(self):
+        """Run the graph and return {stage name: result dict} in declaration order"""
+        results = {}
+        pending = dict(self.stages)
+        running = {}
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, initializer=self.initializer)
+        try:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    if any(dep not in results for dep in stage.deps):
+                        continue
+                    del pending[name]
+                    if self.cancel_event.is_set():
+                        status = STATUS_CANCELLED
+                    elif self._satisfied(stage, results):
+                        print(f"[INFO] Starting stage {name}")
+                        running[pool.submit(self._run_stage, stage)] = name
+                        continue
+                    else:
+                        status = STATUS_NOT_RUN
+                    results[name] = {"stage": name, "status": status, "attempts": 0,
+                                     "duration": 0.0, "error": None}
+                    self._notify(name, results[name])
+                if not running:
+                    continue
+                done, _ = wait(running, timeout=WAIT_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name] = future.result()
+                    print(f"[INFO] Stage {name}: {results[name]['status']}")
+                    self._notify(name, results[name])
+        except BaseException:
+            # e.g. Ctrl+C: running stages see the cancel and kill their tools; do not wait for them here
+            self.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        pool.shutdown()
+        return {name: results[name] for name in self.stages}
+
+    def _notify(self, name, result):
+        if self.on_result:
+            self.on_result(name, result)
+
+    def ok(self, results):
+        return all(r["status"] in (STATUS_OK, STATUS_SKIPPED) or self.stages[name].optional
+                   for name, r in results.items())
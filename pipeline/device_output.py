@@ -0,0 +1,89 @@
+import sys
+import threading
+
+
+class DeviceStream:
+    """Output of one device: every write goes to its log, complete lines to the console with a prefix"""
+
+    def __init__(self, console, prefix, log_path, lock):
+        self.console = console
+        self.prefix = prefix
+        self.log_path = log_path
+        self.log = open(log_path, "a", encoding="utf-8", errors="replace")
+        self.lock = lock
+        self._partial = ""
+
+    def write(self, text):
+        self.log.write(text)
+        self._partial += text.replace("\r", "\n")
+        *lines, self._partial = self._partial.split("\n")
+        lines = [line for line in lines if line.strip()]
+        if lines:
+            with self.lock:
+                self.console.write("".join(f"[{self.prefix}] {line}\n" for line in lines))
+                self.console.flush()
+        return len(text)
+
+    def flush(self):
+        self.log.flush()
+
+    def isatty(self):
+        # Several devices share the console, so live \r bars would overwrite each other
+        return False
+
+    def close(self):
+        if self._partial.strip():
+            self.write("\n")
+        self.log.close()
+
+
+class DeviceOutput:
+    """sys.stdout replacement that routes each device thread's output to its DeviceStream
+
+    Threads that have not called bind() write straight to the console.
+    """
+
+    def __init__(self, console=None):
+        self.console = console or sys.stdout
+        self.lock = threading.Lock()
+        self._local = threading.local()
+
+    def bind(self, prefix, log_path):
+        stream = DeviceStream(self.console, prefix, log_path, self.lock)
+        self._local.stream = stream
+        return stream
+
+    def unbind(self):
+        stream = getattr(self._local, "stream", None)
+        self._local.stream = None
+        if stream is not None:
+            stream.close()
+
+    def attach(self, stream):
+        """Make a worker thread write to a stream bound elsewhere, e.g. bound() of its parent"""
+        self._local.stream = stream if isinstance(stream, DeviceStream) else None
+
+    def bound(self):
+        """The stream for the current thread, e.g. for a helper thread to keep writing to it"""
+        return getattr(self._local, "stream", None) or self.console
+
+    def write(self, text):
+        stream = getattr(self._local, "stream", None)
+        if stream is not None:
+            return stream.write(text)
+        with self.lock:
+            return self.console.write(text)
+
+    def flush(self):
+        self.bound().flush()
+
+    def isatty(self):
+        return self.bound().isatty()
+
+    def __enter__(self):
+        sys.stdout = self
+        return self
+
+    def __exit__(self, *exc):
+        sys.stdout = self.console
+        return False
@@ -0,0 +1,169 @@
+import os
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from pipeline.batch import BatchRunner, default_stage_functions
+from pipeline.dag import WAIT_INTERVAL
+from pipeline.device_output import DeviceOutput
+
+SHARED_STAGES = ("download", "extract")
+MCU_STAGES = ("mcu_meter", "mcu_ivi")
+DISCOVERY_SETTLE = 5.0  # Seconds to keep collecting units after the first one shows up
+DEFAULT_DEVICE_LOG_DIR = os.path.join("utils", "logs", "devices")
+
+
+def _safe_name(key):
+    return re.sub(r"[^\w.-]", "_", os.path.basename(str(key)))
+
+
+class Orchestrator:
+    """Flash every attached unit at the same time, each with its own pipeline
+
+    Download and extract run once; the images they produce are shared
+    read-only. The flash stages then run per unit in a thread pool of
+    job.concurrency workers, each unit waiting only for its own key in the
+    shared DeviceWatcher. Output of each unit goes to its own log file and
+    to the console prefixed with the unit key. Units are job.devices if
+    given, otherwise every Qualcomm unit found at start.
+    """
+
+    def __init__(self, job, watcher=None, stage_functions=None, sleep=time.sleep,
+                 log_dir=DEFAULT_DEVICE_LOG_DIR, settle=DISCOVERY_SETTLE):
+        self.job = job
+        self.watcher = watcher
+        self.stage_functions = dict(stage_functions or {})
+        self.sleep = sleep
+        self.log_dir = log_dir
+        self.settle = settle
+        # Shared by every runner, so Ctrl+C stops all units
+        self.cancel_event = threading.Event()
+        # One shared programmer per MCU type unless units name their own tool serial
+        self._mcu_locks = {stage: threading.Lock() for stage in MCU_STAGES}
+        self._wrap_mcu_stages()
+
+    def _wrap_mcu_stages(self):
+        defaults = default_stage_functions()
+        for stage in MCU_STAGES:
+            func = self.stage_functions.get(stage, defaults[stage])
+            self.stage_functions[stage] = self._serialized(stage, func)
+
+    def _serialized(self, stage, func):
+        lock = self._mcu_locks[stage]
+        serial_key = stage.replace("mcu_", "") + "_serial"
+
+        def run(job, images_path, device, cancel_event):
+            if device.config.get(serial_key):
+                return func(job, images_path, device, cancel_event)
+            with lock:
+                return func(job, images_path, device, cancel_event)
+        return run
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def _get_watcher(self):
+        if self.watcher is None:
+            from hardware.device_watcher import DeviceWatcher
+            self.watcher = DeviceWatcher()
+        return self.watcher
+
+    def discover(self):
+        """Return the keys of the units to flash"""
+        if self.job.devices:
+            return list(self.job.devices)
+        watcher = self._get_watcher()
+        print(f"[INFO] Waiting up to {self.job.device_timeout:.0f}s for units to attach...")
+        if watcher.wait_for(timeout=self.job.device_timeout) is None:
+            return []
+        # Units plugged in together enumerate a little apart
+        self.sleep(self.settle)
+        watcher.poll()
+        return sorted(watcher.devices)
+
+    def _unpinned_units(self, keys):
+        """Units that fastboot could not tell apart from the others"""
+        if len(keys) < 2 or "fastboot" not in self.job.stages:
+            return []
+        return [key for key in keys
+                if not (self.job.devices.get(key, {}).get("uart")
+                        and self.job.devices.get(key, {}).get("fastboot_serial"))]
+
+    def _run_device(self, key, images_path, output):
+        log_path = os.path.join(self.log_dir, f"{time.strftime('%Y%m%d_%H%M%S')}_{_safe_name(key)}.log")
+        output.bind(key, log_path)
+        try:
+            runner = BatchRunner(self.job, stage_functions=self.stage_functions, watcher=self.watcher,
+                                 sleep=self.sleep, device_key=key, cancel_event=self.cancel_event,
+                                 stages=[s for s in self.job.stages if s not in SHARED_STAGES])
+            result = runner.run()
+        except Exception as e:
+            print(f"[ERROR] Pipeline for {key} failed: {e}")
+            result = {"ok": False, "stages": [], "error": f"{type(e).__name__}: {e}"}
+        finally:
+            output.unbind()
+        result["log"] = log_path
+        return result
+
+    def run(self):
+        started_at = time.strftime("%Y-%m-%d %H:%M:%S")
+        start = time.monotonic()
+        results = {"job": self.job.to_dict(), "ok": False, "started_at": started_at,
+                   "shared": [], "devices": {}}
+
+        shared = [s for s in self.job.stages if s in SHARED_STAGES]
+        runner = BatchRunner(self.job, stage_functions=self.stage_functions, watcher=self.watcher,
+                             sleep=self.sleep, stages=shared, cancel_event=self.cancel_event)
+        images_path = runner.images_path()
+        results["images_path"] = images_path
+        if shared:
+            shared_result = runner.run()
+            results["shared"] = shared_result["stages"]
+            if not shared_result["ok"]:
+                results["duration"] = round(time.monotonic() - start, 3)
+                return results
+
+        if os.path.isdir(images_path):
+            # Build the image manifest once, before the units read it concurrently
+            from extract.image_manifest import get_manifest
+            get_manifest(images_path)
+
+        watcher = self._get_watcher()
+        watcher.start()
+        try:
+            keys = self.discover()
+            if not keys:
+                print("[ERROR] No units found.")
+                results["duration"] = round(time.monotonic() - start, 3)
+                return results
+            unpinned = self._unpinned_units(keys)
+            if unpinned:
+                # Without them every unit would use the same debug UART and fastboot device
+                print(f"[ERROR] Fastboot needs 'uart' and 'fastboot_serial' in the job file's 'devices' "
+                      f"for each unit when several are flashed; missing for: {', '.join(unpinned)}")
+                results["error"] = "units without uart/fastboot_serial"
+                results["duration"] = round(time.monotonic() - start, 3)
+                return results
+            print(f"[INFO] Flashing {len(keys)} units, {self.job.concurrency} at a time: {', '.join(keys)}")
+            os.makedirs(self.log_dir, exist_ok=True)
+            with DeviceOutput() as output:
+                pool = ThreadPoolExecutor(max_workers=self.job.concurrency)
+                try:
+                    futures = {key: pool.submit(self._run_device, key, images_path, output) for key in keys}
+                    pending = set(futures.values())
+                    while pending:
+                        _, pending = wait(pending, timeout=WAIT_INTERVAL)
+                except BaseException:
+                    # e.g. Ctrl+C: stop every unit's stages and do not start the units still queued
+                    self.cancel()
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    raise
+                pool.shutdown()
+                results["devices"] = {key: future.result() for key, future in futures.items()}
+        finally:
+            watcher.stop()
+
+        results["ok"] = bool(results["devices"]) and all(r["ok"] for r in results["devices"].values())
+        results["duration"] = round(time.monotonic() - start, 3)
+        return results
@@ -0,0 +1,124 @@
+import os
+import time
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.ini")
+EXTRACT_DIR = os.path.join("utils", "extracted")
+MCU_LOG_DIR = os.path.join("utils", "logs", "mcu")
+
+# MCU component -> (module, function) that programs it
+MCU_STAGES = {
+    "METER": ("software.MCU_METER_controller", "flash_mcu_meter"),
+    "IVI": ("software.MCU_IVI_controller", "flash_mcu_ivi"),
+}
+
+
+def _load(module_name, attribute):
+    """Import a stage module on first use, so only the stages that run are loaded"""
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def _download_module(config_path):
+    download_by_version = importlib.import_module("download.download_by_version")
+    download_by_version.ensure_configured(config_path)
+    return download_by_version
+
+
+def download(version=None, config_path=CONFIG_PATH, select=None, stream_extract=None, cancel_event=None):
+    """Download the files of version; ask for a version until one succeeds if None
+
+    select(name) restricts the download to some of the files and setting
+    cancel_event stops it, see download_by_version.download_version.
+    """
+    download_by_version = _download_module(config_path)
+    if version is None:
+        download_by_version.main(config_path)
+        return True
+    return download_by_version.download_version(version, select, stream_extract, cancel_event)
+
+
+def prefetch(version, config_path=CONFIG_PATH, cancel_event=None):
+    """Download the files of version into the artifact cache without touching the current images"""
+    return _download_module(config_path).prefetch_version(version, cancel_event)
+
+
+def is_release_part(name):
+    return _load("download.download_by_version", "is_release_part")(name)
+
+
+def extract(config_path=CONFIG_PATH, selective=None, select=None, clear=True, cancel_event=None):
+    """Extract the downloaded archives into utils/extracted, return True on success"""
+    try:
+        _load("extract.unzipper", "extract_downloads")(config_path, selective, select, clear, cancel_event)
+    except Exception as e:
+        print(f"[ERROR] Extraction failed: {e}")
+        return False
+    return True
+
+
+def clear_extracted():
+    _load("extract.unzipper", "clear_extract_dir")(EXTRACT_DIR)
+    return True
+
+
+def _unit_log(module_name, log_constant, unit):
+    """The tool log of module for one unit, or None (the tool's own log) without a unit"""
+    if unit is None:
+        return None
+    return _load("software.process_runner", "unit_log_path")(_load(module_name, log_constant), unit)
+
+
+def flash_qfil(images_path, max_attempts=None, port=None, unit=None, cancel_event=None):
+    return _load("software.qfil_controller", "run_qfil_controller")(
+        images_path, max_attempts, port, _unit_log("software.qfil_controller", "FH_LOADER_LOG", unit),
+        cancel_event)
+
+
+def flash_fastboot(images_path, uart_port=None, serial_number=None, unit=None, cancel_event=None):
+    return _load("software.fastboot_flash", "run_fastboot_flash")(
+        images_path, uart_port, serial_number, _unit_log("software.fastboot_flash", "FLASH_LOG", unit),
+        cancel_event)
+
+
+def mcu_settings(config_path=CONFIG_PATH):
+    return _load("software.mcu_tools", "McuSettings")(config_path)
+
+
+def flash_mcu(component, images_path, serial=None, config_path=CONFIG_PATH, unit=None, cancel_event=None):
+    """Program one MCU on the tool bound to serial (default: its [mcu] serial in config.ini)
+
+    With unit (a device key) the rfp-cli output goes to a log of its own.
+    """
+    settings = mcu_settings(config_path)
+    module_name, function_name = MCU_STAGES[component.upper()]
+    return _load(module_name, function_name)(images_path, settings.tool_argument(component, serial),
+                                             settings.rfp_cli, _unit_log(module_name, "RFP_LOG", unit),
+                                             cancel_event)
+
+
+def flash_mcu_concurrent(images_path, components=("METER", "IVI"), config_path=CONFIG_PATH,
+                         log_dir=MCU_LOG_DIR):
+    """Program several MCUs at the same time, each on its own tool; return {component: ok}
+
+    The console output of each component is prefixed with its name and
+    also written to log_dir.
+    """
+    from pipeline.device_output import DeviceOutput
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+    os.makedirs(log_dir, exist_ok=True)
+
+    def run(component, output):
+        output.bind(component, os.path.join(log_dir, f"{stamp}_{component.lower()}_console.log"))
+        try:
+            return flash_mcu(component, images_path, config_path=config_path)
+        except Exception as e:
+            print(f"[ERROR] MCU {component} programming failed: {e}")
+            return False
+        finally:
+            output.unbind()
+
+    with DeviceOutput() as output:
+        with ThreadPoolExecutor(max_workers=len(components)) as pool:
+            futures = {component: pool.submit(run, component, output) for component in components}
+            return {component: future.result() for component, future in futures.items()}
@@ -1,24 +1,43 @@
-import subprocess
 import os
 import sys
 
+# Allow "python software/MCU_METER_controller.py" to import sibling packages
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from extract.image_manifest import get_manifest
+from extract.selective_extract import pull_matching
+from software.process_runner import run_process, RfpCliParser
+from software.progress import ProgressRenderer
+from software.mcu_tools import DEFAULT_TOOL
+
+RFP_TIMEOUT = 600  # Seconds for erase, program and verify of one MCU
+RFP_LOG = os.path.join('utils', 'logs', 'mcu', 'meter.log')
+
 def find_meter_image(folder):
     """Search for a .s19 file that contains 'NCDCMETER' and does NOT contain 'VHSM'"""
-    for root, _, files in os.walk(folder):
-        for file in files:
-            if file.endswith('.s19') and 'NCDCMETER' in file and 'VHSM' not in file:
-                return os.path.join(root, file)
-    return None
+    is_image = lambda file: file.endswith('.s19') and 'NCDCMETER' in file and 'VHSM' not in file
+    matches = get_manifest(folder).find_files(is_image)
+    # A selective extraction may have left the image in its archive
+    if not matches and pull_matching(folder, is_image):
+        matches = get_manifest(folder).find_files(is_image)
+    return matches[0] if matches else None
 
 def find_rfp_exe(search_root):
     """Search recursively under search_root for rfp-cli.exe"""
-    for root, _, files in os.walk(search_root):
-        for file in files:
-            if file.lower() == 'rfp-cli.exe':
-                return os.path.join(root, file)
-    return None
+    # utils also holds the downloads, caches and extracted images; the tool is never there
+    manifest = get_manifest(search_root, skip_dirs=('extracted', 'downloads', 'cache'))
+    matches = manifest.find_files(lambda file: file.lower() == 'rfp-cli.exe')
+    return matches[0] if matches else None
 
-def main(images_path=None):
+def flash_mcu_meter(images_path=None, tool=DEFAULT_TOOL, rfp_path=None, log_path=None, cancel_event=None):
+    """Program the METER MCU with rfp-cli, return True on success
+
+    tool is the rfp-cli -tool value, e.g. "E2:1AS012345" to use the E2
+    with that serial number; rfp_path skips the search for rfp-cli.exe
+    and log_path replaces RFP_LOG. Setting cancel_event kills rfp-cli.
+    """
     base_dir = os.path.dirname(os.path.abspath(__file__))
 
     if images_path is None:
@@ -30,26 +49,26 @@ def main(images_path=None):
 
     if not os.path.isdir(images_path):
         print(f"[ERROR] Provided images_path is not a directory: {images_path}")
-        exit(1)
+        return False
 
     utils_dir = os.path.abspath(os.path.join(base_dir, '..', 'utils'))
 
     image_abs_path = find_meter_image(images_path)
     if not image_abs_path:
         print(f"[ERROR] No valid .s19 image found in {images_path}")
-        exit(1)
+        return False
 
-    rfp_path = find_rfp_exe(utils_dir)
+    rfp_path = rfp_path or find_rfp_exe(utils_dir)
     if not rfp_path:
         print(f"[ERROR] rfp-cli.exe not found under {utils_dir}")
-        exit(1)
+        return False
 
     print(f"[INFO] RFP tool path: {rfp_path}")
     print(f"[INFO] Image file path: {image_abs_path}")
 
     command = (
         f'"{rfp_path}" '
-        '-d RH850 -tool E2 -if uart -osc 8.0 '
+        f'-d RH850 -tool {tool} -if uart -osc 8.0 '
         '-fo opbt FA27FFCF,FFFFFDFF,FFFFFFFF,FFFFFFFF,FFFFFFFF,FFFFFFFF,FFFFFFFF,FFFFFFFF '
         '-e -p -v -fill code '
         f'-file "{image_abs_path}" '
@@ -60,20 +79,25 @@ def main(images_path=None):
     print("-" * 80)
 
     try:
-        with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, shell=True) as proc:
-            for line in proc.stdout:
-                print(line, end='')
-            return_code = proc.wait()
+        with ProgressRenderer("rfp-cli METER", log_path=log_path or RFP_LOG) as renderer:
+            result = run_process(command, shell=True, parsers=[RfpCliParser()], timeout=RFP_TIMEOUT,
+                                 renderer=renderer, cancel_event=cancel_event)
+        return_code = result.returncode
 
         print("-" * 80)
         if return_code == 0:
             print("[INFO] MCU METER programming completed successfully")
+            return True
         else:
             print(f"[ERROR] MCU METER programming failed, return code: {return_code}")
-            exit(return_code)
+            return False
 
     except Exception as e:
         print(f"[ERROR] Exception occurred during MCU METER programming: {e}")
+        return False
+
+def main(images_path=None):
+    if not flash_mcu_meter(images_path):
         exit(1)
 
 if __name__ == "__main__":
@@ -0,0 +1,145 @@
+import os
+import re
+import json
+import time
+from collections import deque
+
+DEFAULT_LOG_DIR = os.path.join("utils", "logs", "boot")
+UART_BUFFER_BYTES = 256 * 1024  # Raw UART output held in memory before older chunks spill to disk
+
+# Timeline event kinds
+EVENT_INDICATOR = "indicator"
+EVENT_RESET = "reset"
+EVENT_PROMPT = "fastboot_prompt"
+EVENT_TIMEOUT = "timeout"
+
+
+class StreamMatcher:
+    """Find fixed patterns in a stream of text chunks in linear time
+
+    Only a tail of len(longest pattern) - 1 characters is kept between
+    chunks, so each chunk is scanned once together with that tail and a
+    pattern split across two chunks is still found. Each occurrence is
+    reported once, in the chunk where it completes.
+    """
+
+    def __init__(self, patterns, ignore_case=False):
+        self.ignore_case = ignore_case
+        self.patterns = [p.lower() if ignore_case else p for p in patterns]
+        self.originals = dict(zip(self.patterns, patterns))
+        self.keep = max((len(p) for p in self.patterns), default=1) - 1
+        self.tail = ""
+
+    def feed(self, chunk):
+        """Return the patterns (as given) that complete in chunk, in stream order"""
+        if self.ignore_case:
+            chunk = chunk.lower()
+        window = self.tail + chunk
+        boundary = len(self.tail)
+        found = []
+        for pattern in self.patterns:
+            # Only occurrences ending inside the new chunk are new
+            start = window.find(pattern, max(0, boundary - len(pattern) + 1))
+            if start != -1:
+                found.append((start, self.originals[pattern]))
+        self.tail = window[-self.keep:] if self.keep else ""
+        return [pattern for _, pattern in sorted(found)]
+
+    def reset(self):
+        self.tail = ""
+
+
+class UartLog:
+    """Raw UART output kept in a bounded in-memory ring buffer that spills to disk
+
+    When the buffer exceeds max_bytes the oldest chunks are appended to
+    spill_path, so memory stays bounded while the file ends up holding the
+    complete log once close() flushes the rest.
+    """
+
+    def __init__(self, spill_path, max_bytes=UART_BUFFER_BYTES):
+        self.spill_path = spill_path
+        self.max_bytes = max_bytes
+        self.chunks = deque()
+        self.size = 0
+        self._file = None
+
+    def write(self, chunk):
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        while self.size > self.max_bytes and len(self.chunks) > 1:
+            self._spill(self.chunks.popleft())
+
+    def tail(self):
+        """Return the most recent output still held in memory"""
+        return "".join(self.chunks)
+
+    def _spill(self, chunk):
+        self.size -= len(chunk)
+        try:
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.spill_path)), exist_ok=True)
+                self._file = open(self.spill_path, "a", encoding="utf-8", errors="replace")
+            self._file.write(chunk)
+        except OSError as e:
+            print(f"[WARN] Could not write UART log {self.spill_path}: {e}")
+
+    def close(self):
+        while self.chunks:
+            self._spill(self.chunks.popleft())
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class BootTimeline:
+    """Per-run boot timeline: monotonic timestamps for indicators, resets and the prompt
+
+    Times are seconds since the timeline was created. save() writes the
+    events and the settings they were measured with as JSON next to the
+    raw UART log, both named after the start time and port.
+    """
+
+    def __init__(self, port=None, log_dir=DEFAULT_LOG_DIR, settings=None):
+        self.port = port
+        self.settings = dict(settings or {})
+        self.started_at = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.start = time.monotonic()
+        self.events = []
+        port_name = re.sub(r"[^\w.-]", "_", os.path.basename(port)) if port else "uart"
+        stem = os.path.join(log_dir, f"{time.strftime('%Y%m%d_%H%M%S')}_{port_name}")
+        self.path = stem + ".json"
+        self.uart_log = UartLog(stem + ".log")
+
+    def mark(self, kind, label=""):
+        """Record an event and return its time in seconds since the start"""
+        elapsed = round(time.monotonic() - self.start, 3)
+        self.events.append({"t": elapsed, "event": kind, "label": label})
+        return elapsed
+
+    def log(self, chunk):
+        self.uart_log.write(chunk)
+
+    def first(self, kind):
+        """Return the time of the first event of kind, or None"""
+        return next((e["t"] for e in self.events if e["event"] == kind), None)
+
+    def save(self, result):
+        self.uart_log.close()
+        data = {
+            "port": self.port,
+            "started_at": self.started_at,
+            "result": result,
+            "duration": round(time.monotonic() - self.start, 3),
+            "settings": self.settings,
+            "events": self.events,
+            "uart_log": self.uart_log.spill_path,
+        }
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+        except OSError as e:
+            print(f"[WARN] Could not save boot timeline: {e}")
+            return None
+        return self.path
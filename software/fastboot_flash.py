@@ -4,33 +4,46 @@ import time
 import os
 import sys
 
+# Allow "python software/fastboot_flash.py" to import sibling packages
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from extract.image_manifest import get_manifest
+from extract.selective_extract import pull_matching, bat_references
+from hardware.uart_finder import find_debug_uart
+from hardware.readiness import (wait_until, port_openable, fastboot_listed, retry_delay,
+                                PORT_READY_TIMEOUT, FASTBOOT_READY_TIMEOUT)
+from software.process_runner import run_process, FastbootParser
+from software.progress import ProgressRenderer
+from software.boot_log import (StreamMatcher, BootTimeline, EVENT_INDICATOR, EVENT_RESET,
+                               EVENT_PROMPT, EVENT_TIMEOUT)
+
 BAUD_RATE = 115200
+FLASH_IDLE_TIMEOUT = 600  # Seconds the flash script may go without printing anything
+FLASH_LOG = os.path.join('utils', 'logs', 'fastboot', 'flash_script.log')
+READ_TIMEOUT = 0.5  # Longest a blocking serial read waits before the loop re-checks timers
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
 def find_lowest_available_com():
-    """Find the lowest available COM port, return port name or None"""
-    for i in range(1, 256):
-        port_name = f'COM{i}'
-        try:
-            with serial.Serial(port_name, BAUD_RATE, timeout=1):
-                print(f"[INFO] Available COM port found: {port_name}")
-                print("Please set the debug version to normal mode and restart the power...")
-                return port_name
-        except serial.SerialException:
-            continue
+    """Find the debug UART COM port, return port name or None"""
+    port_name = find_debug_uart(BAUD_RATE)
+    if port_name:
+        print(f"[INFO] Available COM port found: {port_name}")
+        print("Please set the debug version to normal mode and restart the power...")
+        return port_name
     print("[ERROR] No available COM port found.")
     return None
 
 
-def wait_for_fastboot_prompt(ser):
+def wait_for_fastboot_prompt(ser, timeline=None):
     """Listen to fastboot prompt via serial, send reset command, check if fastboot mode is entered"""
     ser.reset_input_buffer()
     ser.reset_output_buffer()
 
     total_timeout = 60
     start_time = time.time()
-    buffer = ""
     last_reset_time = 0
     RESET_INTERVAL = 10  # Send reset command every 10 seconds
 
@@ -43,59 +56,92 @@ def wait_for_fastboot_prompt(ser):
         "launch io-sock for NS CDC platform."
     ]
 
+    if timeline is None:
+        timeline = BootTimeline(getattr(ser, "port", None))
+    timeline.settings.update(total_timeout=total_timeout, reset_interval=RESET_INTERVAL)
+
+    # Streaming matchers keep only a short tail, so chatty boot logs cost linear time
+    indicator_matcher = StreamMatcher(BOOT_INDICATORS)
+    fastboot_matcher = StreamMatcher(["fastboot"], ignore_case=True)
+    indicator_seen = False
+    fastboot_seen = False
+
+    def send_reset(reason=""):
+        nonlocal last_reset_time, indicator_seen, fastboot_seen
+        try:
+            ser.write(b"reset -f\r\n")
+            ser.flush()
+            print(f"\n[CMD] Sent reset command{reason} at {time.strftime('%H:%M:%S')}")
+            timeline.mark(EVENT_RESET, reason.strip(" ()") or "periodic")
+            last_reset_time = time.time()
+            indicator_matcher.reset()
+            fastboot_matcher.reset()
+            indicator_seen = False
+            fastboot_seen = False
+        except Exception as e:
+            print(f"[ERROR] Failed to send reset command: {e}")
+
     try:
         while (time.time() - start_time) < total_timeout:
             current_time = time.time()
-            
+
             # Periodically send reset command
             if current_time - last_reset_time >= RESET_INTERVAL:
-                try:
-                    ser.write(b"reset -f\r\n")
-                    ser.flush()
-                    print(f"\n[CMD] Sent reset command at {time.strftime('%H:%M:%S')}")
-                    last_reset_time = current_time
-                    buffer = ""
-                except Exception as e:
-                    print(f"[ERROR] Failed to send reset command: {e}")
-
-            if ser.in_waiting:
-                chunk = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                if chunk:
-                    print(f"[LOG] {chunk}", end='')
-                    buffer += chunk
-
-                    # After detecting boot indicators, possibly send reset command again
-                    if any(indicator in buffer for indicator in BOOT_INDICATORS):
-                        if current_time - last_reset_time > 5:
-                            try:
-                                ser.write(b"reset -f\r\n")
-                                ser.flush()
-                                print(f"\n[CMD] Sent reset command (boot indicator detected) at {time.strftime('%H:%M:%S')}")
-                                last_reset_time = current_time
-                                buffer = ""
-                            except Exception as e:
-                                print(f"[ERROR] Failed to send reset command: {e}")
-
-                    # Detect fastboot keyword, return success
-                    if "fastboot" in buffer.lower():
-                        print("\n[SUCCESS] Fastboot mode detected")
-                        time.sleep(2)
-                        return True
-
-            time.sleep(0.01)
+                send_reset()
+
+            # Block until data arrives or the next reset / overall timeout is due
+            next_deadline = min(last_reset_time + RESET_INTERVAL, start_time + total_timeout)
+            ser.timeout = max(0.05, min(READ_TIMEOUT, next_deadline - time.time()))
+            chunk = ser.read(ser.in_waiting or 1).decode('ascii', errors='ignore')
+            if chunk:
+                print(f"[LOG] {chunk}", end='')
+                timeline.log(chunk)
+                hits = indicator_matcher.feed(chunk)
+                for hit in hits:
+                    timeline.mark(EVENT_INDICATOR, hit)
+                indicator_seen = bool(hits) or indicator_seen
+                if fastboot_matcher.feed(chunk):
+                    if not fastboot_seen:
+                        timeline.mark(EVENT_PROMPT, "fastboot")
+                    fastboot_seen = True
+
+                # After detecting boot indicators, possibly send reset command again
+                if indicator_seen and time.time() - last_reset_time > 5:
+                    send_reset(" (boot indicator detected)")
+
+                # Detect fastboot keyword, return success
+                if fastboot_seen:
+                    print("\n[SUCCESS] Fastboot mode detected")
+                    _save_timeline(timeline, True)
+                    return True
 
     except serial.SerialException as e:
         print(f"[ERROR] Serial communication error: {e}")
 
     print("[ERROR] Fastboot mode not detected within timeout.")
+    timeline.mark(EVENT_TIMEOUT)
+    _save_timeline(timeline, False)
     return False
 
 
-def trigger_fastboot():
-    """Find COM port and try to enter fastboot mode"""
-    port = find_lowest_available_com()
+def _save_timeline(timeline, result):
+    """Write the boot timeline and print a one-line summary"""
+    path = timeline.save(result)
+    first_indicator = timeline.first(EVENT_INDICATOR)
+    prompt = timeline.first(EVENT_PROMPT)
+    resets = sum(1 for e in timeline.events if e["event"] == EVENT_RESET)
+    summary = f"first indicator {first_indicator}s, prompt {prompt}s, {resets} resets"
+    if path:
+        print(f"[INFO] Boot timeline ({summary}) saved to {path}")
+
+
+def trigger_fastboot(uart_port=None):
+    """Find COM port (unless uart_port is given) and try to enter fastboot mode"""
+    port = uart_port or find_lowest_available_com()
     if not port:
         return False
+    if not wait_until(lambda: port_openable(port), PORT_READY_TIMEOUT, description=f"debug UART {port}"):
+        return False
 
     try:
         with serial.Serial(
@@ -114,21 +160,27 @@ def trigger_fastboot():
         return False
 
 
-def check_fastboot_device():
-    """Call fastboot command to check if device is online"""
+def check_fastboot_device(serial_number=None):
+    """Call fastboot command to check if device (the one with serial_number, if given) is online
+
+    Continues as soon as "fastboot devices" lists the device instead of
+    waiting a fixed time after the fastboot prompt.
+    """
+    target = ["-s", serial_number] if serial_number else []
+    if not wait_until(lambda: fastboot_listed(serial_number), FASTBOOT_READY_TIMEOUT,
+                      description="fastboot device"):
+        return False
+
     max_attempts = 3
-    for attempt in range(max_attempts):
+    for attempt in range(1, max_attempts + 1):
         try:
-            result = subprocess.check_output(["fastboot", "devices"], stderr=subprocess.STDOUT, text=True)
-            if "fastboot" not in result.lower():
-                time.sleep(5)
-                continue
-
-            result = subprocess.check_output(["fastboot", "getvar", "all"], stderr=subprocess.STDOUT, text=True, timeout=20)
+            result = subprocess.check_output(["fastboot", *target, "getvar", "all"], stderr=subprocess.STDOUT, text=True, timeout=20)
             if "finished. total time" in result.lower() or "all images flashed successfully" in result.lower():
                 return True
-        except Exception:
-            time.sleep(5)
+        except Exception as e:
+            print(f"[WARN] fastboot getvar failed: {e}")
+        if attempt < max_attempts:
+            time.sleep(retry_delay(attempt))
     return False
 
 
@@ -143,82 +195,87 @@ def get_bat_file_path(abs_images_path):
         print(f"[ERROR] Given path does not exist: {abs_images_path}")
         return None
 
-    for root, _, files in os.walk(abs_images_path):
-        for target_file in target_files:
-            if target_file in files:
-                bat_file = os.path.join(root, target_file)
-                print(f"[INFO] Found flash script: {bat_file}")
-                return bat_file
+    matches = get_manifest(abs_images_path).find_files(lambda file: file in target_files)
+    # A selective extraction may have left the script (and so its images) in the archive
+    if not matches and pull_matching(abs_images_path, lambda file: file in target_files):
+        matches = get_manifest(abs_images_path).find_files(lambda file: file in target_files)
+        if matches:
+            references = bat_references(matches[0])
+            pull_matching(abs_images_path, lambda file: file in references)
+    if matches:
+        bat_file = matches[0]
+        print(f"[INFO] Found flash script: {bat_file}")
+        return bat_file
 
     print("[ERROR] Flash script not found.")
     return None
 
-def run_flash_script(abs_images_path):
+def _format_bat_line(line):
+    """Console text for a non-progress bat output line, None to hide it"""
+    line = line.strip()
+    if "pause" in line.lower():
+        return None
+    if "failed" in line.lower() or "error" in line.lower():
+        return f"[BAT] {line}\n[WARN] Flash script reported error: {line}"
+    return f"[BAT] {line}"
+
+
+def _answer_pause(line):
+    """Press Enter for the bat script's pause prompts"""
+    return '\n' if "pause" in line.lower() else None
+
+
+def run_flash_script(abs_images_path, serial_number=None, log_path=None, cancel_event=None):
     """Execute the flash bat script and print progress in real-time"""
     bat_file = get_bat_file_path(abs_images_path)
     if not bat_file:
         return False
 
-    try:
-        process = subprocess.Popen(
-            f'cmd.exe /c "{bat_file}"',
-            shell=True,
-            stdout=subprocess.PIPE,
-            stdin=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1,
-            cwd=os.path.dirname(bat_file)
-        )
-    except Exception as e:
-        print(f"[ERROR] Failed to start flash script: {e}")
-        return False
+    env = None
+    if serial_number:
+        # fastboot commands without -s target the device named in ANDROID_SERIAL
+        env = dict(os.environ, ANDROID_SERIAL=serial_number)
 
     try:
-        while True:
-            output_line = process.stdout.readline()
-            if output_line:
-                line = output_line.strip()
-                if any(x in line for x in ['Sending', 'Writing', 'OKAY']):
-                    print(f"[PROGRESS] {line:<100}", end='', flush=True)
-                    if 'OKAY' in line:
-                        print()
-                elif "pause" in line.lower():
-                    time.sleep(1)
-                    process.stdin.write('\n')
-                    process.stdin.flush()
-                else:
-                    print(f"[BAT] {line}")
-
-                if "failed" in line.lower() or "error" in line.lower():
-                    print(f"[WARN] Flash script reported error: {line}")
-            if process.poll() is not None:
-                break
-            time.sleep(0.01)
+        with ProgressRenderer("fastboot", formatter=_format_bat_line, log_path=log_path or FLASH_LOG) as renderer:
+            result = run_process(
+                f'cmd.exe /c "{bat_file}"',
+                shell=True,
+                cwd=os.path.dirname(bat_file),
+                env=env,
+                parsers=[FastbootParser()],
+                renderer=renderer,
+                respond=_answer_pause,
+                idle_timeout=FLASH_IDLE_TIMEOUT,
+                cancel_event=cancel_event
+            )
     except Exception as e:
         print(f"[ERROR] Error during flash script execution: {e}")
-        try:
-            process.kill()
-        except Exception:
-            pass
         return False
 
-    return process.returncode == 0
+    return result.returncode == 0
 
 
-def run_fastboot_flash(abs_images_path):
+def run_fastboot_flash(abs_images_path, uart_port=None, serial_number=None, log_path=None, cancel_event=None):
     """
     Integration process:
     1. Trigger entering fastboot mode
     2. Verify fastboot device
     3. Run flash script
+
+    uart_port and serial_number pin the debug UART and the fastboot
+    device when several units are attached to the station; log_path
+    replaces FLASH_LOG for the flash script output. Setting cancel_event
+    kills the flash script.
     """
-    if trigger_fastboot():
+    if trigger_fastboot(uart_port):
         print("[INFO] Fastboot mode triggered.")
-        time.sleep(5)
-        if check_fastboot_device():
+        if check_fastboot_device(serial_number):
             print("[INFO] Fastboot device verified.")
-            if run_flash_script(abs_images_path):
+            if cancel_event is not None and cancel_event.is_set():
+                print("[INFO] Fastboot flashing cancelled.")
+                return False
+            if run_flash_script(abs_images_path, serial_number, log_path, cancel_event):
                 print("[SUCCESS] Flash script completed.")
                 return True
             else:
@@ -0,0 +1,44 @@
+import os
+import configparser
+
+DEFAULT_TOOL = "E2"
+COMPONENTS = ("METER", "IVI")
+
+
+class McuSettings:
+    """[mcu] section of config.ini: which rfp-cli tool programs which board
+
+    With meter_serial / ivi_serial set, each board is bound to its own
+    tool with "-tool <tool>:<serial>", so both can be attached (and, with
+    concurrent = true, programmed) at the same time. rfp_cli overrides the
+    rfp-cli.exe found under utils, e.g. to run against a fake tool.
+    """
+
+    def __init__(self, config_path="config.ini"):
+        config = configparser.ConfigParser()
+        config.read(config_path)
+        self.concurrent = config.getboolean("mcu", "concurrent", fallback=False)
+        self.tool = config.get("mcu", "tool", fallback=DEFAULT_TOOL).strip() or DEFAULT_TOOL
+        self.serials = {component: config.get("mcu", f"{component.lower()}_serial", fallback="").strip()
+                        for component in COMPONENTS}
+        rfp_cli = config.get("mcu", "rfp_cli", fallback="").strip()
+        self.rfp_cli = os.path.abspath(rfp_cli) if rfp_cli else None
+
+    def serial(self, component, override=None):
+        return override or self.serials.get(component.upper(), "")
+
+    def tool_argument(self, component, serial=None):
+        """Value for rfp-cli -tool, bound to the board's serial number when one is known"""
+        serial = self.serial(component, serial)
+        return f"{self.tool}:{serial}" if serial else self.tool
+
+    def concurrency_error(self, overrides=None):
+        """Why METER and IVI cannot be programmed at the same time, or None if they can"""
+        overrides = overrides or {}
+        serials = {component: self.serial(component, overrides.get(component)) for component in COMPONENTS}
+        missing = [f"{component.lower()}_serial" for component, serial in serials.items() if not serial]
+        if missing:
+            return f"{' and '.join(missing)} not set, each board needs its own tool"
+        if len(set(serials.values())) < len(serials):
+            return "meter_serial and ivi_serial name the same tool"
+        return None
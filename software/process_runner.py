@@ -0,0 +1,314 @@
+import os
+import re
+import time
+import codecs
+import signal
+import asyncio
+import locale
+import subprocess
+from collections import namedtuple, deque
+
+READ_SIZE = 64 * 1024  # Bytes requested from the pipe per read
+TAIL_CHARS = 64 * 1024  # Output kept in memory per process
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+CANCEL_POLL_INTERVAL = 0.2  # Seconds between checks of the cancel event
+LINE_SPLIT_RE = re.compile(r"\r\n|\r|\n")  # Tools redraw progress with bare \r
+UNSAFE_NAME_RE = re.compile(r"[^\w.-]")
+PERCENT_RE = re.compile(r"(\d{1,3}(?:\.\d+)?)\s*%")
+
+# Typed events produced by the output parsers
+Progress = namedtuple("Progress", "source text percent")
+Result = namedtuple("Result", "source ok text")
+
+# output is the tail kept by the OutputCapture, found the keywords it saw
+ProcessResult = namedtuple("ProcessResult", "returncode output events timed_out duration found")
+
+
+def _percent(text):
+    match = PERCENT_RE.search(text)
+    if not match:
+        return None
+    value = float(match.group(1))
+    return value if 0 <= value <= 100 else None
+
+
+class FhLoaderParser:
+    """fh_loader --showpercentagecomplete output"""
+    name = "fh_loader"
+
+    def parse(self, line):
+        if "All Finished Successfully" in line:
+            return [Result(self.name, True, line)]
+        if "Download Fail" in line or "ERROR: " in line:
+            return [Result(self.name, False, line)]
+        percent = _percent(line)
+        if percent is not None:
+            return [Progress(self.name, line, percent)]
+        return []
+
+
+class FastbootParser:
+    """fastboot Sending/Writing/OKAY lines from the flash bat script"""
+    name = "fastboot"
+    SPARSE_RE = re.compile(r"Sending sparse '([^']+)' (\d+)/(\d+)")
+    STEP_RE = re.compile(r"(Sending|Writing) '([^']+)'")
+
+    def parse(self, line):
+        sparse = self.SPARSE_RE.search(line)
+        if sparse:
+            done, total = int(sparse.group(2)), int(sparse.group(3))
+            return [Progress(self.name, f"Sending {sparse.group(1)}", 100.0 * done / total if total else None)]
+        step = self.STEP_RE.search(line)
+        if step:
+            return [Progress(self.name, f"{step.group(1)} {step.group(2)}", None)]
+        if line.lstrip().startswith("OKAY"):
+            return [Progress(self.name, "OKAY", None)]
+        if line.lstrip().startswith("FAILED"):
+            return [Result(self.name, False, line)]
+        if "Finished. Total time" in line or "All images flashed successfully" in line:
+            return [Result(self.name, True, line)]
+        return []
+
+
+class RfpCliParser:
+    """Renesas rfp-cli erase/program/verify output"""
+    name = "rfp-cli"
+    STEP_RE = re.compile(r"^\s*(Erasing|Writing|Programming|Verifying|Connecting)\b", re.IGNORECASE)
+    ERROR_RE = re.compile(r"^\s*Error\b|\bE\d{7}\b|Verif\w* (?:error|failed)", re.IGNORECASE)
+
+    def parse(self, line):
+        if self.ERROR_RE.search(line):
+            return [Result(self.name, False, line)]
+        if "Operation completed" in line:
+            return [Result(self.name, True, line)]
+        step = self.STEP_RE.search(line)
+        if step:
+            return [Progress(self.name, step.group(1).capitalize(), _percent(line))]
+        return []
+
+
+class ScriptResultParser:
+    """[RESULT] SUCCESS / [RESULT] FAIL lines printed by the project scripts"""
+    name = "script"
+
+    def parse(self, line):
+        if "[RESULT] SUCCESS" in line:
+            return [Result(self.name, True, line)]
+        if "[RESULT] FAIL" in line:
+            return [Result(self.name, False, line)]
+        return []
+
+
+def final_result(events):
+    """Return the ok flag of the last Result event, or None if there was none"""
+    for event in reversed(events):
+        if isinstance(event, Result):
+            return event.ok
+    return None
+
+
+def unit_log_path(path, unit):
+    """Log path of one unit in parallel runs, e.g. fh_loader.log -> fh_loader_1-1.2.log"""
+    root, ext = os.path.splitext(path)
+    return f"{root}_{UNSAFE_NAME_RE.sub('_', str(unit))}{ext}"
+
+
+class RotatingLog:
+    """Append-only text log rotated to path.1 ... path.<backup_count> past max_bytes"""
+
+    def __init__(self, path, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._file = None
+        self._failed = False
+
+    def write(self, text):
+        if self._failed:
+            return
+        try:
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8", errors="replace")
+            self._file.write(text)
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+        except OSError as e:
+            print(f"[WARN] Could not write log {self.path}: {e}")
+            self._failed = True
+
+    def _rotate(self):
+        self.close()
+        for index in range(self.backup_count, 0, -1):
+            source = self.path if index == 1 else f"{self.path}.{index - 1}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index}")
+        if self.backup_count == 0:
+            os.remove(self.path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class OutputCapture:
+    """Constant-memory capture of process output
+
+    Keeps only the last tail_chars characters in a ring of lines, notes
+    which keywords appeared (checked line by line as output streams in)
+    and optionally appends everything to a RotatingLog at log_path.
+    """
+
+    def __init__(self, tail_chars=TAIL_CHARS, keywords=(), log_path=None,
+                 max_log_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+        self.tail_chars = tail_chars
+        self.keywords = tuple(keywords)
+        self.found = set()
+        self.lines = deque()
+        self.size = 0
+        self.log = RotatingLog(log_path, max_log_bytes, backup_count) if log_path else None
+
+    def write(self, line):
+        for keyword in self.keywords:
+            if keyword not in self.found and keyword in line:
+                self.found.add(keyword)
+        self.lines.append(line)
+        self.size += len(line)
+        while self.size > self.tail_chars and len(self.lines) > 1:
+            self.size -= len(self.lines.popleft())
+        if self.log:
+            self.log.write(line)
+
+    def tail(self, chars=None):
+        text = "".join(self.lines)
+        return text if chars is None else text[-chars:]
+
+    def close(self):
+        if self.log:
+            self.log.close()
+
+
+def kill_process_tree(pid):
+    """Kill a process together with every process it started"""
+    if os.name == "nt":
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(pid)],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return
+    try:
+        # The child was started in its own session, so its pid is the group id
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def _start(cmd, shell, cwd, env, interactive):
+    kwargs = dict(
+        stdin=subprocess.PIPE if interactive else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        cwd=cwd,
+        env=env,
+    )
+    if os.name == "nt":
+        kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+    if shell:
+        return await asyncio.create_subprocess_shell(cmd, **kwargs)
+    return await asyncio.create_subprocess_exec(*cmd, **kwargs)
+
+
+async def run_process_async(cmd, parsers=(), on_line=print, on_event=None, respond=None,
+                            timeout=None, idle_timeout=None, shell=False, cwd=None, env=None,
+                            capture=None, renderer=None, cancel_event=None):
+    """Run cmd, reading its output in bulk and turning each line into parser events
+
+    on_line(line) is called for every output line (default: print it),
+    on_event(event) for every Progress/Result a parser returns. If respond
+    is given, respond(line) may return text to write to the process stdin.
+    The whole process tree is killed when timeout (total seconds) or
+    idle_timeout (seconds without output) expires, when cancel_event (a
+    threading.Event) is set, or when the run is cancelled. Output is kept
+    in capture (an OutputCapture, by default one holding the last
+    TAIL_CHARS characters). A renderer (see
+    software/progress.py) replaces on_line/on_event and gets each line
+    together with the events parsed from it.
+    """
+    capture = capture or OutputCapture()
+    start = time.monotonic()
+    proc = await _start(cmd, shell, cwd, env, respond is not None)
+    decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors="replace")
+    events = []
+    timed_out = False
+
+    async def watch_cancel():
+        while not cancel_event.is_set():
+            await asyncio.sleep(CANCEL_POLL_INTERVAL)
+        print(f"[INFO] Cancelled, killing {cmd if shell else cmd[0]}")
+        # The read loop below then sees the end of the output
+        kill_process_tree(proc.pid)
+
+    watcher = asyncio.ensure_future(watch_cancel()) if cancel_event is not None else None
+
+    async def handle(line):
+        capture.write(line + "\n")
+        line_events = [event for parser in parsers for event in parser.parse(line) or ()]
+        events.extend(line_events)
+        if renderer:
+            renderer.feed(line, line_events)
+        else:
+            if on_line:
+                on_line(line)
+            if on_event:
+                for event in line_events:
+                    on_event(event)
+        reply = respond(line) if respond else None
+        if reply:
+            proc.stdin.write(reply.encode())
+            await proc.stdin.drain()
+
+    try:
+        pending = ""
+        while True:
+            wait = idle_timeout
+            if timeout is not None:
+                remaining = start + timeout - time.monotonic()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                wait = remaining if wait is None else min(wait, remaining)
+            data = await asyncio.wait_for(proc.stdout.read(READ_SIZE), wait)
+            if not data:
+                break
+            pending += decoder.decode(data)
+            # Hold back a trailing \r in case its \n arrives with the next read
+            cut = len(pending) - 1 if pending.endswith("\r") else len(pending)
+            lines = LINE_SPLIT_RE.split(pending[:cut])
+            pending = lines.pop() + pending[cut:]
+            for line in lines:
+                await handle(line)
+        pending += decoder.decode(b"", final=True)
+        if pending.rstrip("\r"):
+            await handle(pending.rstrip("\r"))
+        returncode = await proc.wait()
+    except asyncio.TimeoutError:
+        timed_out = True
+        print(f"[ERROR] Process timed out, killing it: {cmd if shell else cmd[0]}")
+        kill_process_tree(proc.pid)
+        returncode = await proc.wait()
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        if proc.returncode is None:
+            # Cancelled (e.g. Ctrl+C) or a callback raised
+            kill_process_tree(proc.pid)
+        capture.close()
+
+    return ProcessResult(returncode, capture.tail(), events, timed_out,
+                         round(time.monotonic() - start, 3), capture.found)
+
+
+def run_process(cmd, **kwargs):
+    """Blocking wrapper around run_process_async, see there for the arguments"""
+    return asyncio.run(run_process_async(cmd, **kwargs))
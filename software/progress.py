@@ -0,0 +1,144 @@
+import sys
+import queue
+import threading
+import time
+
+from software.process_runner import Progress, RotatingLog
+
+REFRESH_INTERVAL = 0.2       # Seconds between console redraws
+NON_TTY_INTERVAL = 2.0       # Seconds between progress lines when stdout is a pipe or file
+BAR_WIDTH = 30
+TEXT_WIDTH = 60
+
+
+def format_bar(label, text, percent):
+    text = text.strip()[:TEXT_WIDTH]
+    if percent is None:
+        return f"[PROGRESS] {label}: {text}"
+    filled = int(BAR_WIDTH * min(percent, 100) / 100)
+    return f"[PROGRESS] {label} [{'#' * filled}{'-' * (BAR_WIDTH - filled)}] {percent:5.1f}% {text}"
+
+
+class ProgressRenderer:
+    """Console renderer for one stage that never blocks the tool it is reading
+
+    feed() only queues work: Progress events replace the stage's single
+    live bar instead of being printed, other lines are passed through
+    formatter (return None to hide a line). A background thread writes
+    the queued lines and redraws the bar every refresh_interval seconds,
+    and appends every raw line to log_path if given. Use as a context
+    manager, or call close() to flush and stop the thread. While several
+    renderers share a TTY (e.g. two MCUs programmed at once), they print
+    progress lines instead of fighting over one live bar.
+    """
+
+    _active = {}  # id(stream) -> number of open renderers
+    _active_lock = threading.Lock()
+
+    def __init__(self, label, formatter=None, log_path=None, stream=None,
+                 refresh_interval=REFRESH_INTERVAL):
+        self.label = label
+        self.formatter = formatter or (lambda line: line)
+        stream = stream or sys.stdout
+        # Under pipeline.device_output the drawing thread must write to this device's stream
+        self.stream = stream.bound() if hasattr(stream, "bound") else stream
+        self.tty = hasattr(self.stream, "isatty") and self.stream.isatty()
+        self.refresh_interval = refresh_interval
+        self.log = RotatingLog(log_path) if log_path else None
+        self._lines = queue.SimpleQueue()
+        self._raw = queue.SimpleQueue()
+        self._bar = None          # Latest (text, percent), replaced by each update
+        self._drawn = ""          # Bar currently shown on the console line
+        self._last_line_bar = None
+        self._last_line_time = 0
+        self._stop = threading.Event()
+        with self._active_lock:
+            self._active[id(self.stream)] = self._active.get(id(self.stream), 0) + 1
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def feed(self, line, events=()):
+        """Called from the process runner for every output line"""
+        if self.log:
+            self._raw.put(line)
+        progress = [e for e in events if isinstance(e, Progress)]
+        if progress:
+            latest = progress[-1]
+            self._bar = (latest.text, latest.percent)
+            return
+        text = self.formatter(line)
+        if text is not None:
+            self._lines.put(text)
+
+    def _drain(self, source):
+        items = []
+        while True:
+            try:
+                items.append(source.get_nowait())
+            except queue.Empty:
+                return items
+
+    def _render(self, final=False):
+        raw = self._drain(self._raw)
+        if raw:
+            self.log.write("\n".join(raw) + "\n")
+
+        out = []
+        lines = self._drain(self._lines)
+        bar = self._bar
+        bar_text = format_bar(self.label, *bar) if bar else ""
+        if self.tty and self._active.get(id(self.stream), 0) > 1 and self._drawn:
+            # Another renderer started on this console, leave the bar line as it is
+            out.append("\n")
+            self._drawn = ""
+        if self.tty and self._active.get(id(self.stream), 0) <= 1:
+            if lines and self._drawn:
+                # Clear the live bar before printing normal lines over it
+                out.append("\r" + " " * len(self._drawn) + "\r")
+                self._drawn = ""
+            out.extend(line + "\n" for line in lines)
+            if bar_text and (bar_text != self._drawn or lines):
+                pad = " " * max(0, len(self._drawn) - len(bar_text))
+                out.append("\r" + bar_text + pad)
+                self._drawn = bar_text
+            if final and self._drawn:
+                out.append("\n")
+                self._drawn = ""
+        else:
+            out.extend(line + "\n" for line in lines)
+            now = time.monotonic()
+            due = final or now - self._last_line_time >= NON_TTY_INTERVAL
+            if bar and bar != self._last_line_bar and due:
+                out.append(bar_text + "\n")
+                self._last_line_bar = bar
+                self._last_line_time = now
+        if out:
+            try:
+                self.stream.write("".join(out))
+                self.stream.flush()
+            except (OSError, ValueError):
+                pass
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            self._render()
+
+    def close(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._render(final=True)
+            with self._active_lock:
+                self._active[id(self.stream)] -= 1
+                if not self._active[id(self.stream)]:
+                    del self._active[id(self.stream)]
+            if self.log:
+                self.log.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
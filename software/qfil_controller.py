@@ -1,9 +1,34 @@
-import subprocess
 import os
+import sys
 import serial.tools.list_ports
 import time
 
-def run_qfil_controller(images_path):
+# Allow "python software/qfil_controller.py" to import sibling packages
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from extract.selective_extract import pull_on_demand
+from extract.image_manifest import get_manifest
+from software.process_runner import run_process, FhLoaderParser, OutputCapture
+from software.progress import ProgressRenderer
+from hardware.readiness import wait_until, port_present, retry_delay, PORT_READY_TIMEOUT
+
+QSAHARA_TIMEOUT = 120          # Seconds for the Sahara handshake and firehose upload
+FH_LOADER_IDLE_TIMEOUT = 300   # Seconds fh_loader may go without printing anything
+FH_LOADER_LOG = os.path.join('utils', 'logs', 'qfil', 'fh_loader.log')
+FH_LOADER_SUCCESS = ["All Finished Successfully", "Success", "Finished"]
+FH_LOADER_FAILURE = ["Download Fail", "ERROR: "]
+
+def run_qfil_controller(images_path, max_attempts=None, port=None, log_path=None, cancel_event=None):
+    """Flash with QSaharaServer and fh_loader, retrying until max_attempts (None: until aborted)
+
+    port selects the EDL port when several units are attached; by default
+    the first Qualcomm 9008 port is used. log_path replaces FH_LOADER_LOG,
+    e.g. to give each unit its own log. Setting cancel_event kills the
+    running tool and stops the retries.
+    """
+    log_path = log_path or FH_LOADER_LOG
     # Correct the path to avoid nested duplicates
     images_path = os.path.abspath(images_path)
     print(f"[INFO] Using images_path: {images_path}")
@@ -30,22 +55,29 @@ def run_qfil_controller(images_path):
         return False
 
     # Find rawprogram0.xml
-    rawprogram_path = find_file(sail_nor, 'rawprogram0.xml')
+    rawprogram_path = find_file(images_path, 'rawprogram0.xml', under=sail_nor)
     if not rawprogram_path:
         print("[ERROR] rawprogram0.xml not found in sail_nor directory.")
         return False
 
     # Find Qualcomm 9008 port
-    qsahara_port = None
-    for port in serial.tools.list_ports.comports():
-        if "9008" in port.description:
-            qsahara_port = port.device
-            break
+    qsahara_port = port
+    if qsahara_port is None:
+        for candidate in serial.tools.list_ports.comports():
+            if "9008" in candidate.description:
+                qsahara_port = candidate.device
+                break
 
     if not qsahara_port:
         print("[ERROR] Qualcomm 9008 port not detected.")
         return False
 
+    # Only check enumeration: opening the port (pyserial purges the RX buffer
+    # on Windows) would throw away the Sahara hello QSaharaServer needs
+    if not wait_until(lambda: port_present(qsahara_port), PORT_READY_TIMEOUT,
+                      description=f"EDL port {qsahara_port}"):
+        return False
+
     com_port = rf'\\.\{qsahara_port}'
 
     # Build QSaharaServer command
@@ -68,65 +100,77 @@ def run_qfil_controller(images_path):
     ]
 
     # Attempt flashing loop
+    attempt = 0
     while True:
+        if cancel_event is not None and cancel_event.is_set():
+            print("[INFO] QFIL flashing cancelled.")
+            return False
+        attempt += 1
+        last_attempt = max_attempts is not None and attempt >= max_attempts
         print("\n[INFO] Running QSaharaServer...")
-        ret, out = _run_subprocess(qsahara_cmd)
+        ret, out, found = _run_subprocess(qsahara_cmd, timeout=QSAHARA_TIMEOUT, cancel_event=cancel_event)
         if ret != 0:
-            if not _prompt_retry("QSaharaServer execution failed"):
+            if not _prompt_retry("QSaharaServer execution failed", last_attempt, attempt, qsahara_port):
                 return False
             continue
 
         print("\n[INFO] Running fh_loader...")
-        ret, out = _run_subprocess(fh_loader_cmd)
+        # Only the tail and the markers stay in memory; the full output goes to the log
+        capture = OutputCapture(keywords=FH_LOADER_SUCCESS + FH_LOADER_FAILURE)
+        with ProgressRenderer("fh_loader", log_path=log_path) as renderer:
+            ret, out, found = _run_subprocess(fh_loader_cmd, parsers=[FhLoaderParser()],
+                                              idle_timeout=FH_LOADER_IDLE_TIMEOUT, capture=capture,
+                                              renderer=renderer, cancel_event=cancel_event)
         print(f"\nfh_loader return code: {ret}")
         print("fh_loader output (last 300 characters):")
         print(out[-300:])
+        failures = [k for k in FH_LOADER_FAILURE if k in found]
+        if failures:
+            print(f"[WARN] fh_loader reported: {', '.join(k.strip(': ') for k in failures)} (full log: {log_path})")
 
-        success_keywords = ["All Finished Successfully", "Success", "Finished"]
-        if ret != 0 and not any(k in out for k in success_keywords):
-            if not _prompt_retry("fh_loader execution failed"):
+        if ret != 0 and not any(k in found for k in FH_LOADER_SUCCESS):
+            if not _prompt_retry("fh_loader execution failed", last_attempt, attempt, qsahara_port):
                 return False
             continue
 
         print("[INFO] Flashing completed.")
         return True
 
-def find_file(start_dir, target_filename):
-    for root, _, files in os.walk(start_dir):
-        if target_filename in files:
-            return os.path.join(root, target_filename)
+def find_file(start_dir, target_filename, under=None):
+    path = get_manifest(start_dir).find_file(target_filename, under=under)
+    if path:
+        return path
+    # A selective extraction may have left the file in its archive
+    if pull_on_demand(start_dir, target_filename):
+        return get_manifest(start_dir).find_file(target_filename, under=under)
     return None
 
 def find_directory(start_dir, target_dirname):
-    for root, dirs, _ in os.walk(start_dir):
-        if target_dirname in dirs:
-            return os.path.join(root, target_dirname)
-    return None
+    return get_manifest(start_dir).find_dir(target_dirname)
 
-def _run_subprocess(cmd):
-    process = subprocess.Popen(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-        bufsize=1
-    )
-    output = []
-    while True:
-        line = process.stdout.readline()
-        if not line and process.poll() is not None:
-            break
-        if line:
-            print(line, end='')
-            output.append(line)
-    retcode = process.wait()
-    return retcode, ''.join(output)
-
-def _prompt_retry(message):
+def _run_subprocess(cmd, parsers=(), timeout=None, idle_timeout=None, capture=None, renderer=None,
+                    cancel_event=None):
+    """Run cmd, return (return code, output tail, keywords seen)"""
+    try:
+        result = run_process(cmd, parsers=parsers, timeout=timeout, idle_timeout=idle_timeout,
+                             capture=capture, renderer=renderer, cancel_event=cancel_event)
+    except OSError as e:
+        print(f"[ERROR] Failed to start {os.path.basename(cmd[0])}: {e}")
+        return -1, '', set()
+    return result.returncode, result.output, result.found
+
+def _prompt_retry(message, last_attempt=False, attempt=1, port=None):
+    """Back off before the next attempt and, with port, wait until it is enumerated again"""
     print(f"\n[ERROR] {message}")
-    print("Retrying in 5 seconds automatically, or press Ctrl+C to abort...")
+    if last_attempt:
+        return False
+    delay = retry_delay(attempt)
+    print(f"Retrying in {delay:.1f} seconds automatically, or press Ctrl+C to abort...")
     try:
-        time.sleep(5)
+        time.sleep(delay)
+        if port and not wait_until(lambda: port_present(port), PORT_READY_TIMEOUT,
+                                   description=f"EDL port {port}"):
+            print("[INFO] Reconnect the device in EDL mode; retrying anyway.")
         return True
     except KeyboardInterrupt:
         print("\n[INFO] User aborted.")